@@ -0,0 +1,24 @@
+"""
+Deploy step: build hashed, precompressed copies of the static assets and the manifest templates use to link them.
+Run from the directory the app runs in (assets.directory may be relative), with the app's settings file.
+"""
+import os
+import sys
+from netl.application import load_settings
+from netl.lib import assets
+
+here = os.path.dirname(os.path.abspath(__file__))
+assets.init(load_settings(sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, 'development.ini')))
+
+built = assets.build()
+total = dict.fromkeys(['plain', 'gzip', 'br'], 0)
+for path in sorted(built):
+    target, size, compressed = built[path]
+    print("%-50s %9d %9s %9s" % (target, size, compressed.get('gzip', '-'), compressed.get('br', '-')))
+    total['plain'] += size
+    for encoding in ('gzip', 'br'):
+        total[encoding] += compressed.get(encoding, size)
+
+print("%d assets built into %s, %d bytes; served gzipped %d, brotli %s" % (
+    len(built), assets.config['directory'], total['plain'], total['gzip'],
+    total['br'] if assets.brotli and assets.config['brotli'] else 'n/a'))
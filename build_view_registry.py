@@ -0,0 +1,51 @@
+"""
+Regenerate netl/view_registry.py from the @view_config decorators in netl.views, for make_app() with
+views.registry = True. With --check, only report whether the registry is out of date (exit status 1 if it is).
+"""
+import os
+import sys
+from pyramid.config import Configurator
+
+here = os.path.dirname(os.path.abspath(__file__))
+path = os.path.join(here, 'netl', 'view_registry.py')
+
+recorded = []
+
+class Recorder(Configurator):
+    """
+    Records the views a scan would add instead of adding them. with_package() (used by view_config) makes more of
+    this class, so every add_view in the scan comes through here.
+    """
+    def add_view(self, view=None, **settings):
+        recorded.append((self.package_name, view, settings))
+
+def dotted(value):
+    if hasattr(value, '__module__') and hasattr(value, '__name__'):
+        module = sys.modules[value.__module__]
+        assert getattr(module, value.__name__, None) is value, "%r is not importable by name" % value
+        return '%s:%s' % (value.__module__, value.__name__)
+    return value
+
+Recorder(settings={}).scan(package='netl.views')
+
+lines = ['"""',
+         'Views found by scanning netl.views, as arguments to add_view. Generated by build_view_registry.py; do not edit.',
+         '"""',
+         'views = [']
+for package, view, settings in sorted(recorded, key=lambda r: (r[0], dotted(r[1]))):
+    # Older view_config passes every argument, None for those not given; add_view defaults them anyway
+    settings = dict((k, dotted(v)) for k, v in settings.items() if v is not None and not k.startswith('_'))
+    settings['view'] = dotted(view)
+    args = ', '.join('%r: %r' % (k, settings[k]) for k in sorted(settings))
+    lines.append('    (%r, {%s}),' % (package, args))
+lines.append(']')
+generated = '\n'.join(lines) + '\n'
+
+current = open(path).read() if os.path.exists(path) else None
+if '--check' in sys.argv:
+    print("view registry is %s" % ('up to date' if generated == current else 'out of date'))
+    sys.exit(0 if generated == current else 1)
+
+with open(path, 'w') as f:
+    f.write(generated)
+print("%d views written to %s" % (len(recorded), path))
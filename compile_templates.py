@@ -0,0 +1,20 @@
+"""
+Build step: compile every template into mako.module_directory, so that no process compiles templates after a deploy.
+Run from the directory the app runs in (module_directory may be relative), with the app's settings file.
+"""
+import os
+import sys
+import time
+from pyramid.config import Configurator
+from netl.application import load_settings
+from netl.lib import templates
+
+here = os.path.dirname(os.path.abspath(__file__))
+settings = load_settings(sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, 'development.ini'))
+if not settings.get('mako.module_directory'):
+    sys.exit("mako.module_directory is not set; there is nowhere to keep compiled templates")
+
+templates.init(Configurator(settings=settings).registry)
+start = time.time()
+count = templates.compile_all()
+print("%d templates compiled into %s in %.1f ms" % (count, settings['mako.module_directory'], (time.time() - start) * 1000))
@@ -0,0 +1,44 @@
+"""
+Response compression cost and savings by level, on a JSON news page like item.list returns, through the middleware:
+fresh responses (compressed every time) vs repeated responses with an ETag (served from the compressed body cache).
+"""
+import json
+import time
+from netl.lib import compress
+
+ROUNDS = 2000
+
+body = json.dumps({'items': [{'date': '2012-03-%02d 10:%02d:00' % (i % 28 + 1, i % 60), 'id': str(100000 + i),
+                              'title': 'News item %d about something that happened' % i} for i in xrange(0, 50)],
+                   'next': '2012-03-01T10:00:00.000000,100000'})
+
+def app_for(etag):
+    def app(environ, start_response):
+        headers = [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))]
+        if etag:
+            headers.append(('ETag', '"page-1"'))
+        start_response('200 OK', headers)
+        return [body]
+    return app
+
+def start_response(status, headers, exc_info=None):
+    return None
+
+environ = {'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': 'gzip, deflate', 'PATH_INFO': '/news'}
+
+print("%d byte response" % len(body))
+for level in (1, 6, 9):
+    for name, etag in (('fresh', False), ('cached', True)):
+        app = compress.Compress(app_for(etag), {'compress.level': level})
+        start = time.time()
+        for i in xrange(0, ROUNDS):
+            out = ''.join(app(dict(environ), start_response))
+        elapsed = time.time() - start
+        print("level %d %-7s %6d responses/s  %5d bytes (%.0f%%)" % (level, name, ROUNDS / elapsed, len(out),
+                                                                   100.0 * len(out) / len(body)))
+
+passthrough = app_for(False)
+start = time.time()
+for i in xrange(0, ROUNDS):
+    ''.join(passthrough(dict(environ), start_response))
+print("uncompressed     %6d responses/s" % (ROUNDS / (time.time() - start)))
@@ -0,0 +1,36 @@
+"""
+Checks of the compression middleware's ETag cache: two routes returning the same ETag must each get their own
+compressed body, fresh or from the cache. In memory only; no server needed.
+"""
+import gzip
+import StringIO
+from netl.lib import compress
+
+bodies = {'/a': 'first route ' * 200, '/b': 'second route ' * 200}
+
+def app(environ, start_response):
+    body = bodies[environ['PATH_INFO']]
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', str(len(body))),
+                              ('ETag', '"same"')])
+    return [body]
+
+middleware = compress.Compress(app, {})
+
+def get(path, query=''):
+    response = {}
+    def start_response(status, headers, exc_info=None):
+        response['headers'] = dict(headers)
+    compressed = ''.join(middleware({'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+                                     'HTTP_ACCEPT_ENCODING': 'gzip'}, start_response))
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    return gzip.GzipFile(fileobj=StringIO.StringIO(compressed)).read()
+
+for round in ('fresh', 'cached'):
+    for path in ('/a', '/b'):
+        body = get(path)
+        assert body == bodies[path], "%s %s served another route's body" % (round, path)
+        print("%-6s %s ok" % (round, path))
+
+stats = compress.stats()['(no route)']
+assert stats['cached'] == 2, stats
+print("%d of %d responses served from the cache" % (stats['cached'], stats['compressed']))
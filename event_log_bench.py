@@ -0,0 +1,81 @@
+"""
+Event log queries over a large log: seeds EVENTS synthetic events across DAYS daily partitions (only if they hold
+fewer), then times each kind of query. Also counts statuses for a day both server-side (count()) and by streaming
+the events to the client, to show what the aggregation saves.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+import itertools
+import random
+import sys
+import time
+import netl.lib.event_log as event_log
+
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+DAYS = 30
+SESSIONS = 200000
+USERS = 20000
+BATCH = 5000
+URLS = ['/', '/news', '/news/search', '/news/trending', '/news/add', '/auth_login', '/identity_get',
+        '/admin/sessions', '/assets/css/site.css'] + ['/news/%d' % i for i in xrange(0, 40)]
+STATUSES = [200] * 90 + [304] * 5 + [302] * 2 + [404] * 2 + [500]
+
+event_log.init({'event_log.mongodb_url': 'mongodb://localhost/',
+                'event_log.mongodb_db': 'event_log_bench',
+                'event_log.partition': 'day'})
+
+end = datetime(2012, 3, 31)
+start = end - timedelta(days=DAYS)
+
+def event(i):
+    # Ordered in time, as a real log would be written
+    t = start + timedelta(seconds=DAYS * 86400.0 * i / EVENTS)
+    if i % 100 == 0:
+        return {'t': t, 'src': 'app', 'p': random.choice(['warn', 'error']), 'action': 'Something went wrong'}
+    e = {'t': t, 'src': 'request', 'p': 'info', 'sid': '%032x' % random.randrange(SESSIONS), 'm': 'GET',
+         'u': random.choice(URLS), 's': random.choice(STATUSES), 'ms': int(random.expovariate(1 / 40.0)),
+         'ua': 'Mozilla/5.0 (bench)'}
+    if random.random() < 0.3:
+        e['uid'] = random.randrange(USERS)
+    return e
+
+existing = event_log.count(start, end)
+if existing < EVENTS:
+    print("Seeding %d events..." % EVENTS)
+    for name in event_log.partitions(start, end):
+        event_log._store().drop_collection(name)
+    seeded = time.time()
+    batch = []
+    for i in xrange(0, EVENTS):
+        batch.append(event(i))
+        if len(batch) == BATCH or i == EVENTS - 1:
+            # A batch may straddle midnight
+            for name, events in itertools.groupby(batch, lambda e: event_log.partition_for(e['t'])):
+                events = list(events)
+                event_log._partition(events[0]['t']).insert(events)
+            batch = []
+    print("Seeded in %.0f s (%.0f events/s)" % (time.time() - seeded, EVENTS / (time.time() - seeded)))
+    event_log.ensure_indexes()
+
+day = end - timedelta(days=1)
+week = end - timedelta(days=7)
+session = '%032x' % 12345
+
+def timed(name, f):
+    begin = time.time()
+    result = f()
+    print("%-44s %9.1f ms  %s" % (name, (time.time() - begin) * 1000, result))
+
+timed('events in range', lambda: event_log.count(start, end))
+timed('session, all days', lambda: len(list(event_log.query(start, end, session=session))))
+timed('user, one day', lambda: len(list(event_log.query(day, end, user=4321))))
+timed('url + 404, one week', lambda: len(list(event_log.query(week, end, url='/news/7', status=404))))
+timed('first 100 errors, all days', lambda: len(list(itertools.islice(event_log.query(start, end, priority='error'),
+                                                                         100))))
+timed('5xx, one week', lambda: len(list(event_log.query(week, end, status={'$gte': 500}, fields=['u', 's']))))
+timed('count by status, one day (server)', lambda: event_log.count(day, end, 's', source='request'))
+timed('count by status, one day (streamed)', lambda: dict(Counter(e['s'] for e in event_log.query(
+    day, end, fields=['s'], source='request'))))
+timed('count by status, all days (server)', lambda: len(event_log.count(start, end, 's', source='request')))
+timed('percentiles /news, one day', lambda: event_log.percentiles(day, end, url='/news'))
+timed('percentiles, all days', lambda: event_log.percentiles(start, end))
@@ -0,0 +1,76 @@
+"""
+Fake OAuth provider for offline load testing of outbound sign-in flows.
+
+Serves the two calls a Facebook-style sign-in makes (token exchange and profile fetch) with keep-alive and a
+configurable artificial latency, then runs concurrent sign-in flows against it through netl.lib.outbound and
+reports throughput. Point facebook.graph_url at http://127.0.0.1:PORT to use it from the app.
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from json import dumps
+import threading
+import time
+import urlparse
+from netl.lib import outbound
+
+PORT = 8765
+LATENCY = 0.05
+FLOWS = 400
+CONCURRENCY = [1, 8, 32]
+
+class Provider(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1 # Send each response in one write rather than a packet per header
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        path, _, query = self.path.partition('?')
+        params = dict(urlparse.parse_qsl(query))
+
+        if path == '/oauth/access_token':
+            body, content_type = 'access_token=token-%s&expires=5183999' % params.get('code'), 'text/plain'
+        elif path == '/me':
+            body, content_type = dumps({'id': params.get('access_token'), 'name': 'Someone'}), 'application/json'
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def serve(port=PORT):
+    server = ThreadingServer(('127.0.0.1', port), Provider)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+def flow(n):
+    graph_url = 'http://127.0.0.1:%d' % PORT
+    token = outbound.get(graph_url + '/oauth/access_token', {'code': n}).form()['access_token']
+    return outbound.get(graph_url + '/me', {'access_token': token}, cache=True).json()
+
+if __name__ == '__main__':
+    server = serve()
+
+    for concurrency in CONCURRENCY:
+        outbound.init({'outbound.max_per_host': concurrency, 'outbound.threads': concurrency})
+        start = time.time()
+        pending = [outbound.submit(flow, n) for n in xrange(0, FLOWS)]
+        for p in pending:
+            p.get()
+        elapsed = time.time() - start
+        print("%2d concurrent: %d sign-in flows in %.2f s, %.1f flows/s (%.0f ms provider latency per call)" % (
+            concurrency, FLOWS, elapsed, FLOWS / elapsed, LATENCY * 1000))
+
+    outbound.close()
+    server.shutdown()
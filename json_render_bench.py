@@ -0,0 +1,76 @@
+"""
+JSON rendering throughput on typical payloads: the stock renderer (json.dumps of views' str()-converted values) vs
+netl.lib.renderer (native datetimes, precompiled row encoders for streamed lists).
+"""
+from datetime import datetime, timedelta
+import json
+import time
+from netl.lib import renderer
+
+ROUNDS = 1000
+TRIALS = 5
+
+class Row(tuple):
+    """
+    Stands in for a SQLAlchemy RowProxy: a tuple of values with keys()
+    """
+    KEYS = ('id', 'dated', 'title', 'content')
+
+    def keys(self):
+        return list(self.KEYS)
+
+    def __getitem__(self, key):
+        return tuple.__getitem__(self, self.KEYS.index(key) if isinstance(key, basestring) else key)
+
+now = datetime(2012, 3, 1, 10, 0, 0)
+rows = [Row((100000 + i, now - timedelta(minutes=i), u'News item %d about something that happened' % i,
+             u'Paragraph of content. ' * 20)) for i in xrange(0, 500)]
+
+def stock_item(item):
+    return {'date': str(item['dated']), 'title': item['title'], 'content': item['content'], 'id': str(item['id'])}
+
+def native_item(item):
+    return {'date': item['dated'], 'title': item['title'], 'content': item['content'], 'id': str(item['id'])}
+
+def stock_stream(items):
+    # As item.list streamed before: one json.dumps per item
+    yield '{"items": ['
+    last = None
+    for item in items:
+        if last is not None:
+            yield ', '
+        yield json.dumps(stock_item(item))
+        last = item
+    yield '], "next": %s}' % json.dumps('cursor')
+
+def native_stream(items):
+    return renderer._stream(items, 'items', native_item, lambda last: {'next': 'cursor'})
+
+payloads = [
+    ('item.get', 1,
+     lambda: json.dumps(stock_item(rows[0])),
+     lambda: renderer.encode(native_item(rows[0]))),
+    ('item.search (20)', 1,
+     lambda: json.dumps({'items': [stock_item(row) for row in rows[:20]], 'next': 'cursor'}),
+     lambda: renderer.encode({'items': [native_item(row) for row in rows[:20]], 'next': 'cursor'})),
+    ('item.list (500, streamed)', 20,
+     lambda: ''.join(stock_stream(rows)),
+     lambda: ''.join(native_stream(rows))),
+    ('500 raw rows', 20,
+     lambda: json.dumps([dict(zip(row.keys(), row)) for row in rows], default=str),
+     lambda: '[%s]' % ', '.join(renderer.encode_row(row) for row in rows)),
+]
+
+print("backend: %s" % renderer.BACKEND)
+for name, divisor, stock, native in payloads:
+    assert json.loads(stock()) == json.loads(native()), name
+    rounds = ROUNDS // divisor
+    # Best of TRIALS, alternating between the two so that both see the same machine load
+    results = [0, 0]
+    for trial in xrange(0, TRIALS):
+        for n, f in enumerate((stock, native)):
+            start = time.time()
+            for i in xrange(0, rounds):
+                f()
+            results[n] = max(results[n], rounds / (time.time() - start))
+    print("%-26s stock %8.0f/s  renderer %8.0f/s  (x%.2f)" % (name, results[0], results[1], results[1] / results[0]))
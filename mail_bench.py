@@ -0,0 +1,60 @@
+"""
+Mail dispatch throughput against a local SMTP stand-in: one connection per message vs a reused connection, then
+the full queue (enqueue, claim, send, mark sent) through MongoDB.
+"""
+import asyncore
+import smtpd
+import threading
+import time
+import netl.lib.mail as mail
+
+MESSAGES = 2000
+PORT = 8025
+
+class Sink(smtpd.SMTPServer):
+    received = 0
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        Sink.received += 1
+
+Sink(('localhost', PORT), None)
+server = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.1})
+server.daemon = True
+server.start()
+
+mail.init({'mail.mongodb_url': 'mongodb://localhost/',
+           'mail.mongodb_db': 'mail_bench',
+           'mail.sender': 'bench@localhost',
+           'mail.smtp_port': PORT,
+           'mail.batch_size': 50})
+
+def message(i):
+    return {'_id': i, 'sender': 'bench@localhost', 'to': 'user%d@localhost' % i,
+            'subject': 'Message %d' % i, 'body': 'You have a new message.\n' * 20}
+
+worker = mail.Worker()
+for name, reuse in [('connection per message', False), ('reused connection', True)]:
+    start = time.time()
+    for i in xrange(0, MESSAGES):
+        worker._send(message(i))
+        if not reuse:
+            worker.close()
+    worker.close()
+    print("%-24s %6d messages/s" % (name, MESSAGES / (time.time() - start)))
+
+mail._queue().drop()
+start = time.time()
+for i in xrange(0, MESSAGES):
+    mail.enqueue('user%d@localhost' % i, 'Message %d' % i, 'You have a new message.\n' * 20)
+print("%-24s %6d messages/s" % ('enqueue', MESSAGES / (time.time() - start)))
+
+received = Sink.received
+worker = mail.Worker()
+start = time.time()
+while worker.send_batch():
+    pass
+worker.close()
+elapsed = time.time() - start
+print("%-24s %6d messages/s (%d sent, %d failed)" % ('queue drain', worker.sent / elapsed, worker.sent, worker.failed))
+assert Sink.received - received == MESSAGES
+mail._queue().drop()
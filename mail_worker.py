@@ -0,0 +1,17 @@
+"""
+Worker process: drain the outbound mail queue. Run as many as needed; each claims its own batches.
+"""
+import netl.lib.mail as mail
+
+mail.init({'mail.mongodb_url': 'mongodb://localhost/',
+           'mail.mongodb_db': 'mail',
+           'mail.sender': 'netl <noreply@localhost>',
+           'mail.smtp_host': 'localhost',
+           'mail.smtp_port': 25})
+
+worker = mail.Worker()
+try:
+    worker.run()
+finally:
+    worker.close()
+    print("%d sent, %d failed attempts, %d abandoned" % (worker.sent, worker.failed, worker.abandoned))
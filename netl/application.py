@@ -0,0 +1,167 @@
+"""
+
+Application factory
+
+make_app() initialises every subsystem and builds the WSGI application from a settings dict. A preforking server
+calls it once in the master, so the work done here (route table, views, templates, password list) is shared by every
+worker; after_fork() and before_exit() are the per-worker hooks. Backends are connected on first use, not here, so
+building the app is quick and needs no running databases.
+
+Settings are usually loaded from an ini file with load_settings(). Each value in the [app:netl] section is read as a
+Python literal (600, True, None, ['a', 'b']) where it parses as one, and as a plain string otherwise.
+
+Views are found by scanning netl.views, which imports and inspects every module. With views.registry = True they
+are instead added from netl.view_registry, a list precomputed by build_view_registry.py; rebuild it whenever a
+@view_config changes.
+
+Usage
+
+from netl.application import load_settings, make_app, after_fork, before_exit
+
+app = make_app(load_settings('development.ini'))
+
+"""
+import ast
+from ConfigParser import RawConfigParser
+from pyramid.config import Configurator
+from netl.lib import assets, compress, event_log, js_errors, mail, outbound, ratelimit, renderer, templates
+import netl.lib.db as db
+import netl.lib.session as session
+import netl.lib.auth as auth
+import netl.lib.pass_check # Preloaded: the password list is built at import
+import netl.model as model
+
+SECTION = 'app:netl'
+
+def load_settings(path):
+    """
+    Read settings from an ini file
+
+    @param path:str
+    @return:dict
+    """
+    parser = RawConfigParser()
+    parser.optionxform = str # Keep keys' case
+    with open(path) as f:
+        parser.readfp(f)
+
+    settings = {}
+    for key, value in parser.items(SECTION):
+        try:
+            settings[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            settings[key] = value
+    return settings
+
+def make_app(settings):
+    """
+    Initialise subsystems and build the WSGI application
+
+    @param settings:dict
+    @return: WSGI application
+    """
+    event_log.init(settings)
+    js_errors.init(settings)
+    db.init(settings)
+    model.popularity.init(settings)
+    session.init(settings)
+    ratelimit.init(settings)
+    outbound.init(settings)
+    mail.init(settings)
+    assets.init(settings)
+    auth.init(model.user.get_request_object)
+
+    config = Configurator(settings=settings)
+    config.add_renderer('json', renderer.factory)
+    templates.init(config.registry)
+
+    config.add_subscriber('netl.lib.event_log.on_request', 'pyramid.events.NewRequest')
+    config.add_subscriber('netl.lib.event_log.on_response', 'pyramid.events.NewResponse')
+
+    config.add_subscriber('netl.lib.session.on_request', 'pyramid.events.NewRequest')
+    config.add_subscriber('netl.lib.session.on_response', 'pyramid.events.NewResponse')
+
+    config.add_subscriber('netl.lib.identity.on_request', 'pyramid.events.NewRequest')
+
+    config.add_subscriber('netl.lib.assets.on_before_render', 'pyramid.events.BeforeRender')
+
+    config.include('pyramid_tm')
+
+    # Note: routing must be here in one spot for ordering purposes.
+
+    # configuration setup
+    config.add_route('session_test','/session_test')
+    config.add_route('session_rotate','/session_rotate')
+    config.add_route('session_expire','/session_expire')
+    config.add_route('csrf_get','/csrf_get')
+    config.add_route('csrf_check','/csrf_check')
+
+    config.add_route('auth_test','/auth_test')
+    config.add_route('auth_login','/auth_login')
+
+
+    config.add_route('facebook.sign_in','/auth/facebook')
+    config.add_route('facebook.authenticate','/auth/facebook/callback')
+
+    config.add_route('identity_get','/identity_get')
+    config.add_route('identity_login','/identity_login')
+    config.add_route('identity_logout','/identity_logout')
+
+    config.add_route('session_admin.counts','/admin/sessions')
+    config.add_route('session_admin.list','/admin/sessions/{user}')
+    config.add_route('session_admin.expire','/admin/sessions/{user}/expire')
+    config.add_route('stats.compression','/admin/compression')
+    config.add_route('stats.events','/admin/events')
+
+    config.add_route('log.js','/log/js')
+
+    config.add_route('index','/')
+    config.add_route('item.list','/news')
+    config.add_route('item.add','/news/add')
+    config.add_route('item.add_many','/news/add_many')
+    config.add_route('item.search','/news/search')
+    config.add_route('item.trending','/news/trending')
+    config.add_route('item.get','/news/{item}')
+
+    config.add_route('favicon','/favicon.ico')
+
+    # Built assets, with hashed names (see netl.lib.assets); the static views serve the unbuilt files
+    config.add_route('assets', settings.get('assets.url_prefix', '/assets') + '/*path')
+
+    config.add_static_view('image', 'netl:/image')
+    config.add_static_view('css', 'netl:/css')
+    config.add_static_view('js', 'netl:/js')
+
+    if settings.get('views.registry'):
+        from netl.view_registry import views
+        for package, view in views:
+            # As a scan would: relative assets resolve against the view's own package
+            config.with_package(package).add_view(**view)
+    else:
+        config.scan(package='netl.views')
+
+    # Commits the configuration, so the route table is complete before any fork
+    app = config.make_wsgi_app()
+    templates.warm()
+    return compress.Compress(app, settings)
+
+def after_fork():
+    """
+    Reset connections, locks and threads inherited from a preforking master
+    """
+    event_log.after_fork()
+    js_errors.after_fork()
+    db.after_fork()
+    model.popularity.after_fork()
+    session.after_fork()
+    ratelimit.after_fork()
+    outbound.after_fork()
+    mail.after_fork()
+
+def before_exit():
+    """
+    Write out anything a worker holds in memory before it exits
+    """
+    model.popularity.shutdown()
+    js_errors.shutdown()
+    compress.report()
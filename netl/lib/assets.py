@@ -0,0 +1,185 @@
+"""
+
+Static asset pipeline
+
+build() copies every file under the asset directories into the build directory. Each copy is renamed after a hash
+of its content (css/site.css becomes css/site.1b2c3d4e5f60.css). Each compressible file also gets a gzip copy
+alongside, plus a brotli copy if the brotli module is installed. A manifest maps original names to hashed names.
+Run it with build_assets.py as a deploy step.
+
+A hashed name changes whenever the content does, so the asset view can let browsers and proxies keep hashed files
+for a year. Files from earlier builds are kept, and the view serves any hashed file in the build directory, not
+only those in the current manifest, so pages rendered before a deploy still load their assets. The view also serves
+the precompressed copy the client accepts, so nothing is compressed per request.
+Templates get URLs through asset_url('css/site.css'). That returns the hashed URL when the file is in the manifest,
+and otherwise the plain static URL, so development works without a build.
+
+Configuration
+
+assets.sources          Asset directories, as asset specs, one per line (default netl:/image, netl:/css, netl:/js)
+assets.directory        Build directory (default data/assets)
+assets.url_prefix       URL the asset view is routed at (default /assets)
+assets.brotli           Also write brotli copies when the module is available (default True)
+assets.max_age          Seconds hashed files may be cached (default one year)
+
+Usage
+
+In templates:
+
+<link rel="stylesheet" href="${asset_url('css/site.css')}"/>
+
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from pyramid.asset import abspath_from_asset_spec
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HASH_LENGTH = 12
+MANIFEST = 'manifest.json'
+# Worth compressing; images and fonts are compressed already
+COMPRESSIBLE = frozenset(['.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.ico', '.map'])
+# Smaller than this and compression saves less than the header costs
+MIN_SIZE = 256
+# Names build() gives files: name.<hash>.ext
+HASHED_NAME = re.compile(r'[^/.][^/]*\.[0-9a-f]{%d}(\.[^/.]+)?\Z' % HASH_LENGTH)
+
+config = {}
+manifest = {} # original path -> hashed path
+
+logging.basicConfig()
+log = logging.getLogger(__file__)
+log.setLevel(logging.DEBUG)
+
+def _hashed_name(path, content):
+    root, ext = os.path.splitext(path)
+    return '%s.%s%s' % (root, hashlib.sha1(content).hexdigest()[:HASH_LENGTH], ext)
+
+def _precompress(target, content):
+    """
+    Write compressed copies of a file next to it, where they are smaller
+
+    @return: dict of encoding -> compressed size
+    """
+    sizes = {}
+
+    with open(target + '.gz', 'wb') as f:
+        # mtime=0 keeps the output stable from build to build
+        compressed = gzip.GzipFile(os.path.basename(target), 'wb', 9, f, 0)
+        compressed.write(content)
+        compressed.close()
+    if os.path.getsize(target + '.gz') < len(content):
+        sizes['gzip'] = os.path.getsize(target + '.gz')
+    else:
+        os.remove(target + '.gz')
+
+    if brotli is not None and config['brotli']:
+        data = brotli.compress(content)
+        if len(data) < len(content):
+            with open(target + '.br', 'wb') as f:
+                f.write(data)
+            sizes['br'] = len(data)
+
+    return sizes
+
+def build():
+    """
+    Build hashed and precompressed copies of every asset, and the manifest
+
+    @return: dict of original path -> (hashed path, size, dict of encoding -> compressed size)
+    """
+    # Files from earlier builds are left in place: pages rendered before a deploy still link to them
+    if not os.path.isdir(config['directory']):
+        os.makedirs(config['directory'])
+
+    built = {}
+    for source in config['sources']:
+        for root, dirs, files in os.walk(source):
+            for filename in files:
+                path = os.path.relpath(os.path.join(root, filename), os.path.dirname(source)).replace(os.sep, '/')
+                with open(os.path.join(root, filename), 'rb') as f:
+                    content = f.read()
+
+                target_path = _hashed_name(path, content)
+                target = os.path.join(config['directory'], target_path)
+                if not os.path.isdir(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
+                with open(target, 'wb') as f:
+                    f.write(content)
+
+                sizes = {}
+                if os.path.splitext(filename)[1].lower() in COMPRESSIBLE and len(content) >= MIN_SIZE:
+                    sizes = _precompress(target, content)
+                built[path] = (target_path, len(content), sizes)
+
+    with open(os.path.join(config['directory'], MANIFEST), 'w') as f:
+        json.dump(dict((path, b[0]) for path, b in built.items()), f, indent=1, sort_keys=True)
+
+    _load_manifest()
+    return built
+
+def _load_manifest():
+    global manifest
+
+    try:
+        with open(os.path.join(config['directory'], MANIFEST)) as f:
+            manifest = json.load(f)
+    except IOError:
+        log.warn("No asset manifest in %s; serving assets unhashed (run build_assets.py)" % config['directory'])
+        manifest = {}
+
+def built(path):
+    """
+    Is a path that of a built file, from this or an earlier build?
+
+    @param path:str Path under the build directory, as css/site.1b2c3d4e5f60.css
+    @return:bool
+    """
+    parts = path.split('/')
+    # Every part must be a plain name, so the path can't leave the build directory
+    if any(part in ('', '.', '..') for part in parts) or not HASHED_NAME.match(parts[-1]):
+        return False
+    return os.path.isfile(os.path.join(config['directory'], *parts))
+
+def url(path):
+    """
+    URL for an asset
+
+    @param path:str Original asset path, as css/site.css
+    @return:str
+    """
+    built = manifest.get(path)
+    if built is None:
+        return '/' + path
+    return '%s/%s' % (config['url_prefix'], built)
+
+def on_before_render(event):
+    """
+    Event handler, adds asset_url() to every template's namespace
+
+    @param event:
+    @return:
+    """
+    event['asset_url'] = url
+
+def init(settings):
+    """
+    Initialise asset subsystem
+
+    @param settings:dict Asset configuration settings (see module docs)
+    @return:
+    """
+    sources = settings.get('assets.sources', 'netl:/image\nnetl:/css\nnetl:/js')
+    config['sources'] = [abspath_from_asset_spec(spec.strip()) for spec in sources.splitlines() if spec.strip()]
+    config['directory'] = settings.get('assets.directory', 'data/assets')
+    config['url_prefix'] = settings.get('assets.url_prefix', '/assets')
+    config['brotli'] = settings.get('assets.brotli', True)
+    config['max_age'] = settings.get('assets.max_age', 365*24*60*60)
+
+    _load_manifest()
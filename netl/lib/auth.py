@@ -1,5 +1,46 @@
+"""
+
+Authorisation
+
+Each account has a role, and each role grants a set of permissions. Permissions are bits and roles are compiled
+once, at init, into masks, so checking a permission is a single AND against the mask of the account already loaded
+for the request; no queries are made beyond loading the account itself.
+
+Who may act as whom (support staff taking on a user's identity) is likewise precomputed per pair of roles: the real
+account needs the act_as permission, and may only act as accounts whose permissions are a subset of its own.
+
+Usage
+
+@auth.require('post_news')
+def add(request):
+    # ...
+
+if not auth.can_act_as(request.auth.real, target_account):
+    raise auth.InsufficientPermissionsException()
+request.identity.act_as(target_account['id'])
+
+"""
 from decorator import decorator
 
+# Bits are assigned in this order; only ever append
+PERMISSIONS = [
+    'admin',
+    'act_as',
+    'view_sessions',
+    'kill_sessions',
+    'post_news',
+]
+
+ROLES = {
+    'admin': ['admin', 'act_as', 'view_sessions', 'kill_sessions', 'post_news'],
+    'support': ['act_as', 'view_sessions', 'post_news'],
+    'user': ['post_news'],
+}
+
+bits = dict((name, 1 << n) for n, name in enumerate(PERMISSIONS))
+masks = {} # role -> permission mask
+acting = {} # (real role, actor role) -> may act as
+
 user_lookup = None
 
 class NoUserException(Exception):
@@ -15,6 +56,27 @@ class Identities(object):
         self.real = real
         self.actor = actor
 
+def mask_for(account):
+    """
+    Permission mask of an account
+
+    :param account: account row
+    :return: int
+    """
+    return masks.get(account['role'], 0)
+
+def can_act_as(real, actor):
+    """
+    May the real account take on the identity of the actor account?
+
+    :param real: account row
+    :param actor: account row
+    :return: bool
+    """
+    if real['id'] == actor['id']:
+        return True
+    return acting.get((real['role'], actor['role']), False)
+
 def _augment_request(request):
     if not request.identity.is_set():
         raise NoUserException()
@@ -24,6 +86,9 @@ def _augment_request(request):
     if not request.auth:
         raise NoUserException()
 
+    if not can_act_as(request.auth.real, request.auth.user):
+        raise InsufficientPermissionsException()
+
 def require_user():
     """
     Decorator that demands a user from the request
@@ -36,23 +101,53 @@ def require_user():
         return f(request)
     return decorator(require_user)
 
-def require_admin():
+def require(permission):
     """
-    Decorator that demands an admin from the request
-    
+    Decorator that demands a user holding the given permission from the request
+
+    :param permission: name from PERMISSIONS
     :return:
     """
-    def require_admin(f, request):
+    bit = bits[permission]
+
+    def require(f, request):
         _augment_request(request)
 
-        if request.auth.user['role'] != 'admin':
-            raise InsufficientPermissions()
+        if not mask_for(request.auth.user) & bit:
+            raise InsufficientPermissionsException()
 
         return f(request)
-    return decorator(require_admin)
+    return decorator(require)
+
+def require_admin():
+    """
+    Decorator that demands an admin from the request
+    
+    :return:
+    """
+    return require('admin')
 
+def compile_roles(roles):
+    """
+    Compile role definitions into permission masks and the act-as table
 
-def init(lookup):
+    :param roles: dict role -> list of permission names
+    :return:
+    """
+    masks.clear()
+    for role, permissions in roles.items():
+        mask = 0
+        for permission in permissions:
+            mask |= bits[permission]
+        masks[role] = mask
+
+    acting.clear()
+    for real, real_mask in masks.items():
+        for actor, actor_mask in masks.items():
+            acting[(real, actor)] = bool(real_mask & bits['act_as']) and actor_mask & ~real_mask == 0
+
+def init(lookup, roles=None):
     global user_lookup
 
-    user_lookup=lookup
\ No newline at end of file
+    user_lookup=lookup
+    compile_roles(roles or ROLES)
@@ -0,0 +1,324 @@
+"""
+
+Response compression
+
+WSGI middleware that gzips responses for clients that accept it. Content types that are compressed already
+(images, archives, and anything with a Content-Encoding, such as precompressed assets) are passed through untouched.
+So are responses smaller than compress.min_size. When a response doesn't give its length, up to min_size bytes are
+held back to decide; past that, the body is compressed as it streams, so a large or streamed response is never
+buffered whole.
+
+Responses with an ETag are often repeated exactly, so their compressed bodies (up to CACHE_ITEM_SIZE) are kept in a
+small LRU cache keyed by path, query string and ETag, since an ETag is only unique per URL. A hit skips compressing.
+The compressed representation carries its own ETag (the original with -gzip appended), and If-None-Match is mapped
+back before the application sees it; a 304 in reply to such a request carries the -gzip ETag again. Every response
+that could have been compressed, compressed or not, carries Vary: Accept-Encoding, so shared caches keep the
+representations apart.
+
+Counts, bytes in and out, and time spent compressing are kept per route and process; see stats() and report().
+
+Configuration
+
+compress.min_size       Smallest response compressed, in bytes (default 1024)
+compress.level          zlib compression level, 1 (fastest) to 9 (smallest) (default 6)
+compress.cache_size     Compressed bodies kept (default 256; 0 disables)
+
+Usage
+
+app = compress.Compress(app, settings)
+
+"""
+from collections import OrderedDict
+import itertools
+import logging
+import threading
+import time
+import zlib
+
+CACHE_ITEM_SIZE = 256*1024
+ETAG_SUFFIX = '-gzip'
+
+# Compressing these gains little or nothing
+SKIP_TYPES = frozenset(['image/png', 'image/jpeg', 'image/gif', 'image/webp', 'application/zip', 'application/gzip',
+                        'application/x-gzip', 'application/pdf', 'audio/mpeg', 'video/mp4', 'font/woff',
+                        'font/woff2', 'application/font-woff'])
+
+_stats = {} # route name -> dict of counters
+_stats_lock = threading.Lock()
+
+logging.basicConfig()
+log = logging.getLogger(__file__)
+log.setLevel(logging.DEBUG)
+
+def _accepts_gzip(environ):
+    for coding in environ.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        parts = coding.strip().split(';')
+        if parts[0].strip().lower() in ('gzip', '*'):
+            q = [p.strip()[2:] for p in parts[1:] if p.strip().startswith('q=')]
+            try:
+                return not q or float(q[0]) > 0
+            except ValueError:
+                return False
+    return False
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+def _add_vary(headers):
+    vary = _header(headers, 'Vary')
+    if vary and 'accept-encoding' in vary.lower():
+        return headers
+    headers = [(k, v) for k, v in headers if k.lower() != 'vary']
+    headers.append(('Vary', vary + ', Accept-Encoding' if vary else 'Accept-Encoding'))
+    return headers
+
+def _gzip_etag(etag):
+    return etag[:-1] + ETAG_SUFFIX + '"' if etag.endswith('"') else etag + ETAG_SUFFIX
+
+def _record(environ, compressed, size_in, size_out, elapsed, cached=False):
+    route = getattr(environ.get('bfg.routes.route'), 'name', None) or '(no route)'
+    with _stats_lock:
+        counters = _stats.get(route)
+        if counters is None:
+            counters = _stats[route] = dict.fromkeys(['responses', 'compressed', 'cached', 'bytes_in', 'bytes_out',
+                                                      'seconds'], 0)
+        counters['responses'] += 1
+        if compressed:
+            counters['compressed'] += 1
+            counters['cached'] += cached
+            counters['bytes_in'] += size_in
+            counters['bytes_out'] += size_out
+            counters['seconds'] += elapsed
+
+def stats():
+    """
+    Compression counters for this process, per route
+
+    @return: dict of route name -> dict of responses, compressed, cached (compressed served from the cache),
+             bytes_in, bytes_out, saved (bytes), ratio and ms (spent compressing)
+    """
+    with _stats_lock:
+        result = dict((route, dict(counters)) for route, counters in _stats.items())
+    for counters in result.values():
+        counters['saved'] = counters['bytes_in'] - counters['bytes_out']
+        counters['ratio'] = float(counters['bytes_out']) / counters['bytes_in'] if counters['bytes_in'] else None
+        counters['ms'] = counters.pop('seconds') * 1000
+    return result
+
+def report():
+    """
+    Log this process's compression counters, one line per route
+
+    @return:
+    """
+    for route, counters in sorted(stats().items()):
+        log.info("%s: %d/%d responses compressed (%d from cache), %d -> %d bytes, %.1f ms" % (
+            route, counters['compressed'], counters['responses'], counters['cached'], counters['bytes_in'],
+            counters['bytes_out'], counters['ms']))
+
+class Compress(object):
+    """
+    Middleware compressing responses from app (see module docs)
+    """
+    def __init__(self, app, settings):
+        self.app = app
+        self.min_size = settings.get('compress.min_size', 1024)
+        self.level = settings.get('compress.level', 6)
+        self.cache_size = settings.get('compress.cache_size', 256)
+        self._cache = OrderedDict() # (path, query string, ETag) -> compressed body, least recently used first
+        self._cache_lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if not _accepts_gzip(environ) or environ['REQUEST_METHOD'] == 'HEAD':
+            # Not compressed, but the response still varies by Accept-Encoding
+            def identity(status, headers, exc_info=None):
+                if self._eligible(status, headers):
+                    headers = _add_vary(headers)
+                return start_response(status, headers, exc_info)
+            return self.app(environ, identity)
+
+        response = {}
+
+        # The client may be revalidating the compressed representation
+        if ETAG_SUFFIX in environ.get('HTTP_IF_NONE_MATCH', ''):
+            environ['HTTP_IF_NONE_MATCH'] = environ['HTTP_IF_NONE_MATCH'].replace(ETAG_SUFFIX + '"', '"')
+            response['gzip_validator'] = True
+
+        def capture(status, headers, exc_info=None):
+            if exc_info and response.get('started'):
+                # Too late to change anything; the server re-raises
+                return start_response(status, headers, exc_info)
+            response['status'] = status
+            response['headers'] = headers
+
+            # An application writing through write() is passed through uncompressed
+            def write(data):
+                self._start(start_response, response, False)
+                return response['write'](data)
+            return write
+
+        body = self.app(environ, capture)
+        try:
+            if 'status' not in response:
+                # A generator application calls start_response as it yields its first chunk
+                iterator = iter(body)
+                body = _Chain(list(itertools.islice(iterator, 1)), iterator, body)
+            return self._respond(environ, start_response, response, body)
+        except:
+            if hasattr(body, 'close'):
+                body.close()
+            raise
+
+    def _eligible(self, status, headers):
+        # Would be compressed for a client that accepts it, if big enough
+        if not status.startswith('200'):
+            return False
+        if _header(headers, 'Content-Encoding') or 'no-transform' in (_header(headers, 'Cache-Control') or ''):
+            return False
+        content_type = (_header(headers, 'Content-Type') or '').split(';')[0].strip().lower()
+        return content_type not in SKIP_TYPES and not content_type.startswith('video/')
+
+    def _start(self, start_response, response, compressed):
+        if response.get('started'):
+            return
+        response['started'] = True
+        headers = response['headers']
+        if compressed:
+            headers = [(k, v) for k, v in headers if k.lower() not in ('content-length', 'etag')]
+            headers.append(('Content-Encoding', 'gzip'))
+            headers = _add_vary(headers)
+            etag = _header(response['headers'], 'ETag')
+            if etag:
+                headers.append(('ETag', _gzip_etag(etag)))
+            if response.get('length') is not None:
+                headers.append(('Content-Length', str(response['length'])))
+        response['write'] = start_response(response['status'], headers)
+
+    def _respond(self, environ, start_response, response, body):
+        if response.get('started'):
+            # The application used write()
+            return body
+
+        if response['status'].startswith('304'):
+            # Revalidated: describe the representation the client holds
+            headers = _add_vary(response['headers'])
+            etag = _header(headers, 'ETag')
+            if etag and response.get('gzip_validator'):
+                headers = [(k, v) for k, v in headers if k.lower() != 'etag'] + [('ETag', _gzip_etag(etag))]
+            response['headers'] = headers
+            self._start(start_response, response, False)
+            return body
+
+        if not self._eligible(response['status'], response['headers']):
+            _record(environ, False, 0, 0, 0)
+            self._start(start_response, response, False)
+            return body
+
+        length = _header(response['headers'], 'Content-Length')
+        if length is not None and int(length) < self.min_size:
+            _record(environ, False, 0, 0, 0)
+            response['headers'] = _add_vary(response['headers'])
+            self._start(start_response, response, False)
+            return body
+
+        etag = _header(response['headers'], 'ETag')
+        key = None
+        if etag and self.cache_size:
+            key = (environ.get('PATH_INFO', ''), environ.get('QUERY_STRING', ''), etag)
+            with self._cache_lock:
+                cached = self._cache.pop(key, None)
+                if cached is not None:
+                    self._cache[key] = cached
+            if cached is not None:
+                if hasattr(body, 'close'):
+                    body.close()
+                size_in, compressed = cached
+                _record(environ, True, size_in, len(compressed), 0, cached=True)
+                response['length'] = len(compressed)
+                self._start(start_response, response, True)
+                return [compressed]
+
+        return self._stream(environ, start_response, response, body, key)
+
+    def _stream(self, environ, start_response, response, body, key):
+        # Hold back up to min_size bytes to find out whether the response is big enough to compress
+        held = []
+        held_size = 0
+        iterator = iter(body)
+        for chunk in iterator:
+            held.append(chunk)
+            held_size += len(chunk)
+            if held_size >= self.min_size:
+                break
+        else:
+            if hasattr(body, 'close'):
+                body.close()
+            _record(environ, False, 0, 0, 0)
+            response['headers'] = _add_vary(response['headers'])
+            self._start(start_response, response, False)
+            return held
+
+        self._start(start_response, response, True)
+        return self._compress(environ, _Chain(held, iterator, body), key)
+
+    def _compress(self, environ, body, key):
+        # wbits 31: gzip framing
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        size_in = size_out = 0
+        elapsed = 0.0
+        keep = [] if key else None
+        try:
+            for chunk in body:
+                start = time.time()
+                data = compressor.compress(chunk)
+                elapsed += time.time() - start
+                size_in += len(chunk)
+                if data:
+                    size_out += len(data)
+                    if keep is not None:
+                        keep.append(data)
+                        if size_out > CACHE_ITEM_SIZE:
+                            keep = None
+                    yield data
+
+            start = time.time()
+            data = compressor.flush()
+            elapsed += time.time() - start
+            size_out += len(data)
+            if keep is not None and size_out <= CACHE_ITEM_SIZE:
+                keep.append(data)
+                self._store(key, size_in, b''.join(keep))
+            yield data
+        finally:
+            body.close()
+            _record(environ, True, size_in, size_out, elapsed)
+
+    def _store(self, key, size_in, compressed):
+        with self._cache_lock:
+            self._cache.pop(key, None)
+            self._cache[key] = (size_in, compressed)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+class _Chain(object):
+    """
+    Chunks already read, then the rest of the application's iterable; closes the original
+    """
+    def __init__(self, head, iterator, original):
+        self.head = head
+        self.iterator = iterator
+        self.original = original
+
+    def __iter__(self):
+        for chunk in self.head:
+            yield chunk
+        for chunk in self.iterator:
+            yield chunk
+
+    def close(self):
+        if hasattr(self.original, 'close'):
+            self.original.close()
@@ -1,9 +1,11 @@
 from sqlalchemy import engine_from_config
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.sql import text
 from zope.sqlalchemy import ZopeTransactionExtension
 from zope.sqlalchemy.datamanager import mark_changed
 
 Session = scoped_session(sessionmaker(extension=ZopeTransactionExtension()))
+engine = None
 
 def query(query, **kwargs):
     db = Session()
@@ -11,7 +13,58 @@ def query(query, **kwargs):
     mark_changed(db)
     return result_proxy
 
+def stream(query, chunk_size=500, **kwargs):
+    """
+    Run a read-only query through a server-side cursor, yielding rows as they arrive rather than loading the
+    whole result into memory.
+
+    Runs on its own connection outside the request transaction, so the generator remains usable after the
+    transaction manager has committed (ie while a WSGI app_iter is being consumed). The connection is released
+    when the generator is exhausted or closed.
+
+    @param query:str SQL
+    @param chunk_size:int Rows fetched from the server per round-trip
+    @return: generator of rows
+    """
+    connection = engine.connect()
+    try:
+        result_proxy = connection.execution_options(stream_results=True).execute(text(query), **kwargs)
+        while True:
+            rows = result_proxy.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+        result_proxy.close()
+    finally:
+        connection.close()
+
+def execute(query, **kwargs):
+    """
+    Run a statement on its own connection and commit it immediately, independently of any request transaction.
+    For background work (flushes, maintenance) that must not ride along with, or wait for, a request.
+
+    @param query:str SQL
+    @return:
+    """
+    connection = engine.connect()
+    try:
+        transaction = connection.begin()
+        connection.execute(text(query), **kwargs)
+        transaction.commit()
+    finally:
+        connection.close()
+
 def init(settings):
+    global engine
+
     engine=engine_from_config(settings, 'sqlalchemy.')
     Session.configure(bind=engine)
-    
\ No newline at end of file
+    
+
+def after_fork():
+    """
+    Drop pooled connections inherited from the parent; a forked worker opens its own on demand
+    """
+    Session.remove()
+    engine.dispose()
@@ -5,10 +5,49 @@ Event log
 Logs events into mongodb for analysis. Also offers event handlers to log pretty much everything from a request/response
 including timing information.
 
+Events are written to one collection per day (log_20120301), or per hour (log_2012030114) with event_log.partition
+= hour. Each partition gets the same indexes (INDEXES) when it is first written. find() queries every partition that
+covers a time range, in order. Retention drops whole partitions, which costs nothing like deleting old events from
+one big collection: drop_before() does it, and each process calls it with event_log.keep when it rolls over to a new
+partition.
+
+Documents use short keys, to keep storage and indexes small. Every event has:
+
+t       Time, UTC (for a request, when it started)
+src     Source, as given to send()
+p       Priority: debug, info, warn or error
+
+plus the keyword arguments given to send(), as they are. Request events (source 'request') also have:
+
+sid     Session id
+uid     User id, if signed in (rid: the real user's id, when acting as another user)
+m       Method
+u       Path
+q       Query parameters, if any
+f       Form (POST) parameters, if any
+s       Status code
+ms      Duration, in milliseconds
+ua      User-Agent
+ref     Referer, if any
+
+Headers beyond those are not kept; in particular cookies are not logged. Nor are the values of parameters that look
+secret (passwords, tokens, OAuth codes; see SECRET_PARAMS), which are replaced by REDACTED.
+
+query() selects events by session, user, path, status, priority or source over a time range, through an index
+(field, t) for each. count() and percentiles() aggregate in MongoDB, so only the totals cross the wire: percentiles
+of request duration are estimated from a histogram of ms built per partition.
+
+With event_log.live_size set, every event is also written to log_live, a capped collection of that many bytes. Old
+events fall off the end, so it never grows. follow() tails it with a tailable cursor, so an admin feed gets events
+pushed to it as they are logged, without polling or scanning the log.
+
 Configuration
 
 event_log.mongodb_url     MongoDB url
 event_log.mongodb_db      MongoDB database
+event_log.partition       day or hour (default day)
+event_log.keep            Seconds events are kept (default none: forever)
+event_log.live_size       Size of the capped log_live collection, in bytes (default 0: no live collection)
 
 Usage
 
@@ -16,24 +55,277 @@ import event_log
 
 event_log.warn('auth',user=request.auth,action='Attempt to access admin controls')
 
+for event in event_log.query(start, end, session=session_id):
+    ...
+
+event_log.count(start, end, 's', url='/news')                       # {200: 10512, 404: 3}
+event_log.percentiles(start, end, (50, 99), url='/news', status=200)  # {50: 12.4, 99: 181.0}
+
+for event in event_log.follow(since=last_seen_id):
+    ...
+
 
 """
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
+import re
+import time
+from bson.objectid import ObjectId
 import pymongo
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+# Indexes every partition has
+INDEXES = [
+    [('t', pymongo.ASCENDING)],
+    [('sid', pymongo.ASCENDING), ('t', pymongo.ASCENDING)],
+    [('uid', pymongo.ASCENDING), ('t', pymongo.ASCENDING)],
+    [('u', pymongo.ASCENDING), ('t', pymongo.ASCENDING)],
+    [('s', pymongo.ASCENDING), ('t', pymongo.ASCENDING)],
+    [('p', pymongo.ASCENDING), ('t', pymongo.ASCENDING)],
+    [('src', pymongo.ASCENDING), ('t', pymongo.ASCENDING)],
+]
+# query() filters -> document keys
+FILTERS = {'session': 'sid', 'user': 'uid', 'url': 'u', 'status': 's', 'priority': 'p', 'source': 'src'}
+# Histogram bucket widths for percentiles(), in ms: (below, width)
+BUCKETS = [(100, 1), (1000, 10), (10000, 100), (None, 1000)]
+# Events fetched per round trip when streaming
+BATCH_SIZE = 1000
+# Parameters whose values are never logged
+SECRET_PARAMS = re.compile(r'pass|secret|token|csrf|\Acode\Z', re.I)
+REDACTED = '(redacted)'
+PARTITION_FORMATS = {'day': '%Y%m%d', 'hour': '%Y%m%d%H'}
+PARTITION_NAME = re.compile(r'log_(\d{8}|\d{10})\Z')
 
 config = {}
 mongodb = None
+prepared = set() # partitions this process has indexed
+latest = None # latest partition this process has written to
 
 logging.basicConfig()
 log = logging.getLogger(__file__)
 log.setLevel(logging.DEBUG)
 
+def _store():
+    global mongodb
+
+    # Connected on first use, not in init(), so configuring the app costs nothing and a forked worker connects itself
+    if mongodb is None:
+        mongodb = pymongo.Connection(config['mongodb_url'])
+        if config['live_size']:
+            try:
+                mongodb[config['mongodb_db']].create_collection('log_live', capped=True, size=config['live_size'])
+            except CollectionInvalid:
+                # Created already, by this or another process
+                pass
+    return mongodb[config['mongodb_db']]
+
+def partition_for(when):
+    """
+    Name of the partition an event logged at a given time goes into
+
+    @param when:datetime UTC
+    @return:str
+    """
+    return 'log_' + when.strftime(PARTITION_FORMATS[config['partition']])
+
+def _span(name):
+    # Time range a partition covers, from its name; day and hour partitions can coexist after a change of setting
+    digits = PARTITION_NAME.match(name).group(1)
+    if len(digits) == 8:
+        start = datetime.strptime(digits, '%Y%m%d')
+        return start, start + timedelta(days=1)
+    start = datetime.strptime(digits, '%Y%m%d%H')
+    return start, start + timedelta(hours=1)
+
+def partitions(start=None, end=None):
+    """
+    Partitions holding events in a time range, oldest first
+
+    @param start:datetime UTC (default: from the first)
+    @param end:datetime UTC, exclusive (default: to the last)
+    @return: list of collection names
+    """
+    names = []
+    for name in _store().collection_names():
+        if PARTITION_NAME.match(name):
+            span_start, span_end = _span(name)
+            if (start is None or span_end > start) and (end is None or span_start < end):
+                names.append(name)
+    return sorted(names, key=_span)
+
+def _partition(when):
+    global latest
+
+    name = partition_for(when)
+    store = _store()
+    if name not in prepared:
+        # Index a partition before first writing to it. A request that started before a rollover and ends after it
+        # writes to the previous partition, which is prepared already.
+        for keys in INDEXES:
+            store[name].ensure_index(keys)
+        prepared.add(name)
+
+    if latest is None or _span(name)[0] > _span(latest)[0]:
+        # Rolling over: drop what has expired
+        latest = name
+        if config['keep']:
+            drop_before(datetime.utcnow() - timedelta(seconds=config['keep']))
+    return store[name]
+
+def ensure_indexes():
+    """
+    Create INDEXES on every existing partition. New partitions get them when first written; this is for partitions
+    made before an index was added.
+
+    @return:
+    """
+    store = _store()
+    for name in partitions():
+        for keys in INDEXES:
+            store[name].ensure_index(keys)
+
+def drop_before(when):
+    """
+    Drop every partition holding only events older than a given time
+
+    @param when:datetime UTC
+    @return: list of the partitions dropped
+    """
+    store = _store()
+    dropped = [name for name in partitions(end=when) if _span(name)[1] <= when]
+    for name in dropped:
+        store.drop_collection(name)
+    if dropped:
+        log.info("Dropped event log partitions %s" % ', '.join(dropped))
+    return dropped
+
+def find(start, end, spec=None, fields=None):
+    """
+    Events in a time range, oldest first, from every partition covering it
+
+    @param start:datetime UTC
+    @param end:datetime UTC, exclusive
+    @param spec:dict Further conditions events must match, as {'sid': session_id}
+    @param fields: Fields to return (default all)
+    @return: generator of event dicts
+    """
+    store = _store()
+    for name in partitions(start, end):
+        query = dict(spec or {})
+        query['t'] = {'$gte': start, '$lt': end}
+        cursor = store[name].find(query, fields=fields).sort('t', pymongo.ASCENDING).batch_size(BATCH_SIZE)
+        for event in cursor:
+            yield event
+
+def _spec(filters):
+    spec = {}
+    for name, value in filters.items():
+        if name not in FILTERS:
+            raise TypeError("Unknown event log filter %r" % name)
+        if value is not None:
+            spec[FILTERS[name]] = value
+    return spec
+
+def query(start, end, fields=None, **filters):
+    """
+    Events in a time range matching the given filters, oldest first, streamed from MongoDB in batches.
+
+    Filters are session, user (id), url (path), status (code), priority and source. Each takes a value, or a MongoDB
+    condition such as {'$gte': 500}.
+
+    @param start:datetime UTC
+    @param end:datetime UTC, exclusive
+    @param fields: Fields to return (default all)
+    @return: generator of event dicts
+    """
+    return find(start, end, _spec(filters), fields)
+
+def _aggregate(start, end, filters, group):
+    # Run a $group per partition; returns the rows of every partition, to be merged by the caller
+    spec = _spec(filters)
+    spec['t'] = {'$gte': start, '$lt': end}
+    store = _store()
+    rows = []
+    for name in partitions(start, end):
+        result = store[name].aggregate([{'$match': spec}, {'$group': group}])
+        rows.extend(result['result'] if isinstance(result, dict) else result)
+    return rows
+
+def count(start, end, by=None, **filters):
+    """
+    Count events in a time range matching the given filters (as query()), counted in MongoDB
+
+    @param by:str Document key to count by, as 's' or 'uid' (default: a single total)
+    @return: int total, or dict of value -> count
+    """
+    rows = _aggregate(start, end, filters, {'_id': '$' + by if by else None, 'n': {'$sum': 1}})
+    if by is None:
+        return sum(row['n'] for row in rows)
+
+    counts = {}
+    for row in rows:
+        counts[row['_id']] = counts.get(row['_id'], 0) + row['n']
+    return counts
+
+def _bucket():
+    # Expression for the start of the histogram bucket an event's ms falls in
+    expression = None
+    for below, width in reversed(BUCKETS):
+        bucket = {'$subtract': ['$ms', {'$mod': ['$ms', width]}]}
+        expression = bucket if below is None else {'$cond': [{'$lt': ['$ms', below]}, bucket, expression]}
+    return expression
+
+def _width(bucket):
+    for below, width in BUCKETS:
+        if below is None or bucket < below:
+            return width
+
+def histogram(start, end, **filters):
+    """
+    Histogram of request durations in a time range, for events matching the given filters (as query()), built in
+    MongoDB. Buckets are finer for short durations (see BUCKETS).
+
+    @return: list of (bucket start in ms, bucket width in ms, count), by bucket
+    """
+    filters.setdefault('source', 'request')
+    counts = {}
+    for row in _aggregate(start, end, filters, {'_id': _bucket(), 'n': {'$sum': 1}}):
+        if row['_id'] is not None:
+            counts[row['_id']] = counts.get(row['_id'], 0) + row['n']
+    return [(bucket, _width(bucket), counts[bucket]) for bucket in sorted(counts)]
+
+def percentiles(start, end, ps=(50, 90, 99), **filters):
+    """
+    Estimate percentiles of request duration in a time range, for events matching the given filters (as query()).
+    Estimates are interpolated within histogram buckets, so they are within a bucket width of the true value.
+
+    @param ps: Percentiles wanted
+    @return: dict of percentile -> ms (None if there were no events)
+    """
+    buckets = histogram(start, end, **filters)
+    total = sum(n for bucket, width, n in buckets)
+    result = {}
+    for p in ps:
+        result[p] = None
+        if not total:
+            continue
+        rank = total * p / 100.0
+        seen = 0
+        for bucket, width, n in buckets:
+            if seen + n >= rank:
+                result[p] = bucket + width * (rank - seen) / n
+                break
+            seen += n
+    return result
+
 def send(source, priority, **kwargs):
-    kwargs['dated'] = datetime.now()
-    kwargs['source'] = source
-    kwargs['priority'] = priority
-    mongodb[config['mongodb_db']].log.insert(kwargs)
+    kwargs.setdefault('t', datetime.utcnow())
+    kwargs['src'] = source
+    kwargs['p'] = priority
+    _partition(kwargs['t']).insert(kwargs)
+    if config['live_size']:
+        # insert() left the _id in kwargs, so the live copy has the same id
+        _store().log_live.insert(kwargs)
 
 def debug(source, **kwargs):
     send(source, 'debug', **kwargs)
@@ -47,8 +339,62 @@ def warn(source, **kwargs):
 def error(source, **kwargs):
     send(source, 'error', **kwargs)
 
+def position():
+    """
+    Where the live collection is up to: following from here yields only events logged after this call
+
+    @return: ObjectId of the latest event, or if there are none, one before any event logged from now on
+    """
+    last = list(_store().log_live.find(fields=['_id']).sort('$natural', pymongo.DESCENDING).limit(1))
+    if last:
+        return last[0]['_id']
+    return ObjectId.from_datetime(datetime.utcnow())
+
+def follow(since=None, spec=None, poll=1):
+    """
+    Follow the live collection, yielding events as they are logged, oldest first. The generator yields None each time
+    the stream goes quiet (about once a second while it is), so the caller can give up or send a keepalive.
+
+    If the cursor is lost, because the collection is empty or because events were logged faster than they were read
+    and its position was overwritten, it is reopened after the last event yielded.
+
+    Resuming compares ids, which are only in order within a process. An event logged by another process in the same
+    second as since may be missed.
+
+    @param since: ObjectId of the last event seen, or a position(), to resume after; None starts with the next event
+                  logged
+    @param spec:dict Further conditions events must match, as {'p': 'error'}
+    @param poll: Seconds to wait before reopening a lost cursor
+    @return: generator of event dicts (and None)
+    """
+    live = _store().log_live
+    if since is None:
+        since = position()
+
+    while True:
+        query = dict(spec or {})
+        query['_id'] = {'$gt': since}
+        cursor = live.find(query, tailable=True, await_data=True)
+        try:
+            while cursor.alive:
+                # With await_data the server holds each empty read for a while, so this doesn't spin
+                for event in cursor:
+                    since = event['_id']
+                    yield event
+                yield None
+        except OperationFailure as e:
+            log.warn("Live event cursor lost, resuming after %s: %s" % (since, e))
+        finally:
+            cursor.close()
+
+        yield None
+        time.sleep(poll)
+
 
 
+def _params(params):
+    return dict((name, REDACTED if SECRET_PARAMS.search(name) else value) for name, value in params.items())
+
 def on_request(event):
     """
     Log start of request
@@ -57,7 +403,7 @@ def on_request(event):
     @return:
     """
     event.request._tracking = {
-        'start': datetime.now()
+        'start': time.time()
     }
 
 def on_response(event):
@@ -67,25 +413,30 @@ def on_response(event):
     @param event:
     @return:
     """
+    start = event.request._tracking['start']
     entry = dict()
-    entry['start'] = event.request._tracking['start']
-    entry['end'] = datetime.now()
-    entry['session'] = event.request.session.id
+    entry['t'] = datetime.utcfromtimestamp(start)
+    entry['ms'] = int(round((time.time() - start) * 1000))
+    entry['sid'] = event.request.session.id
 
     if hasattr(event.request,'auth') and event.request.auth:
-        entry['auth'] = event.request.auth
+        entry['uid'] = event.request.auth.user['id']
+        if event.request.auth.real['id'] != entry['uid']:
+            entry['rid'] = event.request.auth.real['id']
 
     if event.request.GET:
-        entry['GET'] = dict(event.request.GET)
+        entry['q'] = _params(event.request.GET)
 
     if event.request.POST:
-        entry['POST'] = dict(event.request.POST)
+        entry['f'] = _params(event.request.POST)
+
+    entry['m'] = event.request.method
+    entry['u'] = event.request.path
+    entry['s'] = event.response.status_int
+    entry['ua'] = event.request.user_agent
 
-    entry['method'] = event.request.method
-    entry['req_headers'] = dict(event.request.headers)
-    entry['url'] = event.request.path_qs
-    entry['status'] = event.response.status
-    entry['res_headers'] = dict(event.response.headers)
+    if event.request.referer:
+        entry['ref'] = event.request.referer
 
     info('request',**entry)
 
@@ -98,7 +449,23 @@ def init(settings):
     @param settings:dict Event log configuration settings (see module docs)
     @return:
     """
-    global mongodb
+    global mongodb, latest
 
-    mongodb = pymongo.Connection(settings.get('event_log.mongodb_url'))
+    config['mongodb_url'] = settings.get('event_log.mongodb_url')
     config['mongodb_db'] = settings.get('event_log.mongodb_db')
+    config['partition'] = settings.get('event_log.partition', 'day')
+    config['keep'] = settings.get('event_log.keep')
+    config['live_size'] = settings.get('event_log.live_size', 0)
+    mongodb = None
+    prepared.clear()
+    latest = None
+
+def after_fork():
+    """
+    Drop the connection in a forked worker; sockets inherited from the parent must not be shared
+
+    @return:
+    """
+    global mongodb
+
+    mongodb = None
@@ -86,6 +86,7 @@ class Identity(object):
         self.id = actor_id
         self.request.session['real_id'] = real_id
         self.request.session['actor_id'] = actor_id
+        self.request.session.set_owner(real_id, actor_id)
 
         self.request.session.rotate()
         log.debug("Set identity as %s (real), %s (actor)" % (self.real_id, self.id))
@@ -106,6 +107,7 @@ class Identity(object):
         """
         self.id = actor_id
         self.request.session['actor_id'] = actor_id
+        self.request.session.set_owner(self.real_id, actor_id)
         log.debug("Switched actor identity to %s" % actor_id)
 
     def logout(self):
@@ -128,9 +130,11 @@ class Identity(object):
         """
         log.debug("Logging out all %s" % self.real_id)
 
+        self.request.session.expire_user(self.real_id)
+
         self.real_id = None
         self.id = None
-        self.request.session.expire_match({'real_id': self.id})
+        self.request.session.expire()
         self.request.session.reset()
 
     def changed_credentials(self):
@@ -143,7 +147,10 @@ class Identity(object):
         log.debug("Changing credentials %s (real) acting as %s" % (self.real_id, self.id))
 
         assert self.id, 'You cannot change credentials without a valid identity'
-        self.request.session.expire_match({'actor_id': self.id})
+        self.request.session.expire_user(self.id)
+
+        # This session made the change, so it carries on under the new credentials
+        self.request.session.set_owner(self.real_id, self.id)
         if self.id == self.real_id:
             self.request.session.rotate()
 
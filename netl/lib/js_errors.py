@@ -0,0 +1,198 @@
+"""
+
+Javascript error collection
+
+Browsers report their errors in batches (see the log.js view). One broken page can report the same error thousands
+of times a minute, so errors are not logged as they arrive. Each is fingerprinted by its normalised message and
+stack: numbers, origins, query strings and asset hashes are taken out, so the same fault fingerprints the same
+from every page, client and deploy. Occurrences are counted per fingerprint in memory and written to the event log
+once per window, as one error event per fingerprint:
+
+src     'js'
+fp      Fingerprint (sha1 hex)
+n       Occurrences in the window
+first   Time of the first occurrence, UTC
+last    Time of the last occurrence, UTC
+msg     Message (as first reported)
+stack   Stack (as first reported)
+urls    Pages it occurred on (up to MAX_SAMPLES)
+sids    Sessions it occurred in (up to MAX_SAMPLES)
+ua      User-Agent of the first report
+
+The number of distinct fingerprints pending is bounded; reaching the bound forces an early flush. Pending counts are
+flushed on shutdown, and lost if the process dies without one. Like the event log, that's not a big deal.
+
+Configuration
+
+js_errors.window          Seconds between flushes (default 60)
+js_errors.max_pending     Distinct errors held in memory before an early flush (default 1000)
+js_errors.max_body        Largest report accepted, in bytes (default 65536)
+js_errors.max_batch       Most errors accepted in one report (default 20)
+
+Usage
+
+js_errors.record(request.session.id, request.user_agent, [{'message': ..., 'stack': ..., 'url': ...}])
+
+"""
+from datetime import datetime
+import atexit
+import hashlib
+import logging
+import re
+import threading
+from netl.lib import event_log
+
+MAX_MESSAGE = 1000
+MAX_STACK = 10000
+MAX_URL = 2000
+# Pages and sessions kept per error
+MAX_SAMPLES = 10
+
+# Taken out before fingerprinting: query strings, scheme and host, content hashes of built assets, numbers
+NORMALISE = [
+    (re.compile(r'\?[^\s:)]*'), ''),
+    (re.compile(r'[a-z][a-z0-9+.-]*://[^/\s]+', re.I), ''),
+    (re.compile(r'\.[0-9a-f]{12}\.(js|css)\b'), r'.\1'),
+    (re.compile(r'\d+'), '0'),
+]
+
+config = {}
+
+_pending = {}
+_lock = threading.Lock()
+_stop = threading.Event()
+_flusher = None
+
+logging.basicConfig()
+log = logging.getLogger(__file__)
+log.setLevel(logging.DEBUG)
+
+def normalise(text):
+    """
+    Take out the parts of a message or stack that vary between occurrences of the same error
+
+    @param text:unicode
+    @return:unicode
+    """
+    for pattern, replacement in NORMALISE:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+def fingerprint(message, stack):
+    """
+    @param message:unicode
+    @param stack:unicode
+    @return:str sha1 hex of the normalised message and stack
+    """
+    return hashlib.sha1(('%s\n%s' % (normalise(message), normalise(stack))).encode('utf-8')).hexdigest()
+
+def record(session_id, user_agent, errors):
+    """
+    Count occurrences of errors reported by a browser
+
+    @param session_id:str
+    @param user_agent:str
+    @param errors: list of dicts of message, and optionally stack and url (unicode, truncated to MAX_*)
+    @return:
+    """
+    if _flusher is None:
+        _start()
+
+    now = datetime.utcnow()
+    with _lock:
+        for error in errors:
+            message = error['message'][:MAX_MESSAGE]
+            stack = (error.get('stack') or u'')[:MAX_STACK]
+            url = (error.get('url') or u'')[:MAX_URL]
+
+            key = fingerprint(message, stack)
+            pending = _pending.get(key)
+            if pending is None:
+                pending = _pending[key] = {'fp': key, 'n': 0, 'first': now, 'msg': message, 'stack': stack,
+                                           'urls': [], 'sids': [], 'ua': user_agent}
+            pending['n'] += 1
+            pending['last'] = now
+            if url and url not in pending['urls'] and len(pending['urls']) < MAX_SAMPLES:
+                pending['urls'].append(url)
+            if session_id not in pending['sids'] and len(pending['sids']) < MAX_SAMPLES:
+                pending['sids'].append(session_id)
+        full = len(_pending) >= config['max_pending']
+
+    if full:
+        flush()
+
+def flush():
+    """
+    Write an event for each error counted since the last flush
+
+    @return:
+    """
+    global _pending
+
+    with _lock:
+        pending = _pending
+        _pending = {}
+
+    for error in pending.values():
+        try:
+            event_log.error('js', **error)
+        except Exception:
+            log.exception("Dropped %d occurrences of javascript error %s" % (error['n'], error['fp']))
+
+    if pending:
+        log.debug("Flushed %d javascript errors" % len(pending))
+
+def _run():
+    while not _stop.wait(config['window']):
+        flush()
+
+def shutdown():
+    """
+    Stop the background flusher and write out anything pending
+
+    @return:
+    """
+    _stop.set()
+    if _flusher:
+        _flusher.join()
+    flush()
+
+def init(settings):
+    """
+    Initialise javascript error collection. The background flusher starts with the first recorded error.
+
+    @param settings:dict Javascript error configuration settings (see module docs)
+    @return:
+    """
+    config['window'] = settings.get('js_errors.window', 60)
+    config['max_pending'] = settings.get('js_errors.max_pending', 1000)
+    config['max_body'] = settings.get('js_errors.max_body', 64*1024)
+    config['max_batch'] = settings.get('js_errors.max_batch', 20)
+
+    # init may run again (a reload re-creates the application); shutdown only needs registering once
+    if not config.get('registered'):
+        atexit.register(shutdown)
+        config['registered'] = True
+
+def _start():
+    global _flusher
+
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run, name='js-errors-flush')
+            _flusher.daemon = True
+            _flusher.start()
+
+def after_fork():
+    """
+    Start afresh in a forked worker: the flusher thread did not survive the fork, and errors pending in the parent
+    are the parent's to write
+
+    @return:
+    """
+    global _pending, _lock, _stop, _flusher
+
+    _pending = {}
+    _lock = threading.Lock()
+    _stop = threading.Event()
+    _flusher = None
@@ -0,0 +1,305 @@
+"""
+
+Outbound mail queue
+
+Views never talk to SMTP. enqueue() stores the message in MongoDB, which is a single quick insert, and a separate
+worker process (mail_worker.py) drains the queue. The worker claims messages in batches, sends each batch over one
+reused SMTP connection, and retries failures with exponential backoff up to mail.max_attempts. Messages claimed by
+a worker that died are returned to the queue after mail.lease seconds; that counts as a failed attempt, so a message
+that kills every worker sending it is given up on in the end. A worker renews its claim on each message just before
+sending it, and only updates messages still under its claim, so a slow batch is neither sent twice nor overwrites
+the state of a message someone else has claimed since.
+
+Configuration
+
+mail.mongodb_url        MongoDB url
+mail.mongodb_db         MongoDB database
+mail.sender             Default From address
+mail.smtp_host          SMTP server (default localhost)
+mail.smtp_port          SMTP port (default 25)
+mail.smtp_user          SMTP username, if the server requires authentication
+mail.smtp_password      SMTP password
+mail.smtp_tls           True to STARTTLS after connecting
+mail.batch_size         Messages claimed and sent per batch (default 50)
+mail.max_attempts       Attempts before a message is given up on (default 8)
+mail.retry_base         Seconds before the first retry; doubles with each attempt (default 30)
+mail.lease              Seconds a claimed message is held before being returned to the queue (default 300)
+mail.keep_sent          Seconds sent messages are kept for inspection (default 7 days)
+
+Usage
+
+from netl.lib import mail
+
+mail.enqueue('someone@example.com', 'New message', 'You have a new message...')
+
+"""
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+import logging
+import os
+import smtplib
+import socket
+import time
+import pymongo
+
+config = {}
+mongodb = None
+
+logging.basicConfig()
+log = logging.getLogger(__file__)
+log.setLevel(logging.DEBUG)
+
+def _queue():
+    global mongodb
+
+    # Connected on first use, so views that never send mail cost nothing
+    if mongodb is None:
+        mongodb = pymongo.Connection(config['mongodb_url'])
+        queue = mongodb[config['mongodb_db']].mail
+        queue.ensure_index([('status', pymongo.ASCENDING), ('next_attempt', pymongo.ASCENDING)])
+        queue.ensure_index('sent', expireAfterSeconds=config['keep_sent'])
+    return mongodb[config['mongodb_db']].mail
+
+def enqueue(to, subject, body, sender=None):
+    """
+    Queue a plain text message for sending
+
+    @param to:str Recipient address
+    @param subject:str
+    @param body:str|unicode
+    @param sender:str From address (default mail.sender)
+    @return: queued message id
+    """
+    now = datetime.utcnow()
+    return _queue().insert({
+        'status': 'queued',
+        'to': to,
+        'sender': sender or config['sender'],
+        'subject': subject,
+        'body': body,
+        'attempts': 0,
+        'created': now,
+        'next_attempt': now,
+    })
+
+def claim(limit, worker):
+    """
+    Claim up to limit queued messages that are due for sending
+
+    @param limit:int
+    @param worker:str Claiming worker's name
+    @return:list of message documents
+    """
+    claimed = []
+    while len(claimed) < limit:
+        now = datetime.utcnow()
+        doc = _queue().find_and_modify({'status': 'queued', 'next_attempt': {'$lte': now}},
+                                       {'$set': {'status': 'sending', 'worker': worker, 'claimed': now}},
+                                       sort=[('next_attempt', pymongo.ASCENDING)], new=True)
+        if not doc:
+            break
+        claimed.append(doc)
+    return claimed
+
+def _retry(doc, error, condition=None):
+    """
+    Return a message to the queue after a failed attempt, to be tried again after a backoff, or give up on it once
+    it has had mail.max_attempts
+
+    @param doc: message document, as claimed
+    @param error: what went wrong
+    @param condition:dict Further conditions the message must still meet to be updated
+    @return:bool True if the message was given up on
+    """
+    spec = dict(condition or {})
+    spec['_id'] = doc['_id']
+    attempts = doc['attempts'] + 1
+    if attempts >= config['max_attempts']:
+        log.warn("Giving up on mail %s to %s: %s" % (doc['_id'], doc['to'], error))
+        _queue().update(spec, {'$set': {'status': 'failed', 'attempts': attempts, 'error': str(error)}})
+        return True
+
+    delay = config['retry_base'] * 2 ** (attempts - 1)
+    log.debug("Mail %s to %s failed, retrying in %d s: %s" % (doc['_id'], doc['to'], delay, error))
+    _queue().update(spec, {'$set': {
+        'status': 'queued',
+        'attempts': attempts,
+        'error': str(error),
+        'next_attempt': datetime.utcnow() + timedelta(seconds=delay)}})
+    return False
+
+def recover():
+    """
+    Return messages whose claim has outlived the lease (their worker died) to the queue, as a failed attempt
+
+    @return:int Number of messages recovered
+    """
+    expired = datetime.utcnow() - timedelta(seconds=config['lease'])
+    recovered = 0
+    for doc in _queue().find({'status': 'sending', 'claimed': {'$lt': expired}}):
+        # Only if still unfinished under the same claim; its worker may have been slow rather than dead
+        _retry(doc, "Lease expired, claimed by %s" % doc.get('worker'),
+               {'status': 'sending', 'claimed': doc['claimed']})
+        recovered += 1
+    return recovered
+
+class Worker(object):
+    """
+    Drains the queue over a reused SMTP connection
+    """
+    name = None
+    sent = None # Messages sent
+    failed = None # Attempts that failed (including those that will be retried)
+    abandoned = None # Messages given up on
+
+    def __init__(self, name=None):
+        self.name = name or '%s:%d' % (socket.gethostname(), os.getpid())
+        self.sent = 0
+        self.failed = 0
+        self.abandoned = 0
+        self._smtp = None
+
+    def _connection(self):
+        if self._smtp is None:
+            smtp = smtplib.SMTP(config['smtp_host'], config['smtp_port'], timeout=30)
+            if config['smtp_tls']:
+                smtp.starttls()
+            if config['smtp_user']:
+                smtp.login(config['smtp_user'], config['smtp_password'])
+            self._smtp = smtp
+        return self._smtp
+
+    def close(self):
+        """
+        Close the SMTP connection, if open
+        """
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, socket.error):
+                pass
+            self._smtp = None
+
+    def _send(self, doc):
+        message = MIMEText(doc['body'], 'plain', 'utf-8')
+        message['From'] = doc['sender']
+        message['To'] = doc['to']
+        message['Subject'] = doc['subject']
+
+        # The server may have dropped an idle connection; reconnect once
+        try:
+            self._connection().sendmail(doc['sender'], [doc['to']], message.as_string())
+        except smtplib.SMTPServerDisconnected:
+            self._smtp = None
+            self._connection().sendmail(doc['sender'], [doc['to']], message.as_string())
+
+    def _held(self, doc):
+        # Conditions for the message to still be under this worker's claim
+        return {'status': 'sending', 'worker': self.name, 'claimed': doc['claimed']}
+
+    def _renew(self, doc):
+        """
+        Renew the claim on a message just before sending it, so a long batch doesn't outlive the lease
+
+        @return:bool False if the claim was lost (the message was recovered, and may have been claimed again)
+        """
+        spec = self._held(doc)
+        spec['_id'] = doc['_id']
+        now = datetime.utcnow()
+        if not _queue().find_and_modify(spec, {'$set': {'claimed': now}}):
+            return False
+        doc['claimed'] = now
+        return True
+
+    def _failed(self, doc, error):
+        self.failed += 1
+        if _retry(doc, error, self._held(doc)):
+            self.abandoned += 1
+
+    def send_batch(self):
+        """
+        Claim and send one batch
+
+        @return:int Number of messages claimed
+        """
+        batch = claim(config['batch_size'], self.name)
+        for doc in batch:
+            if not self._renew(doc):
+                log.warn("Lost the claim on mail %s to %s; not sending" % (doc['_id'], doc['to']))
+                continue
+
+            try:
+                self._send(doc)
+            except (smtplib.SMTPException, socket.error) as e:
+                # Don't reuse a connection in an unknown state
+                if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                    self.close()
+                self._failed(doc, e)
+                continue
+
+            self.sent += 1
+            spec = self._held(doc)
+            spec['_id'] = doc['_id']
+            _queue().update(spec, {'$set': {'status': 'sent', 'sent': datetime.utcnow()}})
+
+        return len(batch)
+
+    def run(self, idle_sleep=1, idle_close=30):
+        """
+        Send until stopped. The SMTP connection is closed after idle_close seconds without anything to send.
+        """
+        idle_since = None
+        last_recover = 0
+        while True:
+            if time.time() - last_recover > config['lease'] / 2:
+                recover()
+                last_recover = time.time()
+
+            start = time.time()
+            count = self.send_batch()
+            if count:
+                idle_since = None
+                log.debug("Sent batch of %d in %.2f s (%d sent, %d failed, %d abandoned in total)" % (
+                    count, time.time() - start, self.sent, self.failed, self.abandoned))
+                continue
+
+            if idle_since is None:
+                idle_since = time.time()
+            elif time.time() - idle_since > idle_close:
+                self.close()
+            time.sleep(idle_sleep)
+
+def init(settings):
+    """
+    Initialise mail subsystem
+
+    @param settings:dict Mail configuration settings (see module docs)
+    @return:
+    """
+    global mongodb
+
+    config['sender'] = settings.get('mail.sender')
+    config['smtp_host'] = settings.get('mail.smtp_host', 'localhost')
+    config['smtp_port'] = settings.get('mail.smtp_port', 25)
+    config['smtp_user'] = settings.get('mail.smtp_user')
+    config['smtp_password'] = settings.get('mail.smtp_password')
+    config['smtp_tls'] = settings.get('mail.smtp_tls', False)
+    config['batch_size'] = settings.get('mail.batch_size', 50)
+    config['max_attempts'] = settings.get('mail.max_attempts', 8)
+    config['retry_base'] = settings.get('mail.retry_base', 30)
+    config['lease'] = settings.get('mail.lease', 5*60)
+    config['keep_sent'] = settings.get('mail.keep_sent', 7*24*60*60)
+
+    config['mongodb_url'] = settings.get('mail.mongodb_url')
+    config['mongodb_db'] = settings.get('mail.mongodb_db')
+    mongodb = None
+
+def after_fork():
+    """
+    Drop the connection in a forked worker
+
+    @return:
+    """
+    global mongodb
+
+    mongodb = None
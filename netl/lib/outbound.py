@@ -0,0 +1,269 @@
+"""
+
+Outbound HTTP
+
+Shared client for calls to other services (OAuth providers and the like). Connections are kept alive and reused
+per host, each host has a cap on concurrent requests so one slow provider can't tie up every worker thread, and every
+request has a timeout. Successful GETs can be cached for a short time, which suits provider metadata and profile
+lookups repeated within a sign-in flow.
+
+Calls block the calling thread. To overlap several calls, start them with submit() and collect the results later;
+they run on a small shared thread pool.
+
+Configuration
+
+outbound.timeout            Seconds before a request is abandoned (default 10)
+outbound.max_per_host       Concurrent requests allowed per host (default 8)
+outbound.cache_ttl          Default seconds to cache GET responses when caching is asked for (default 60)
+outbound.threads            Threads available to submit() (default 8)
+
+Usage
+
+from netl.lib import outbound
+
+response = outbound.post('https://graph.facebook.com/oauth/access_token', {'code': code, ...})
+profile = outbound.get('https://graph.facebook.com/me', {'access_token': token}, cache=True).json()
+
+pending = [outbound.submit(outbound.get, url) for url in urls]
+responses = [p.get() for p in pending]
+
+"""
+from collections import OrderedDict
+import errno
+import httplib
+import json
+import logging
+import socket
+import threading
+import time
+import urllib
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+CACHE_SIZE = 1000
+# Methods safe to send again when a reused connection turns out to be stale
+IDEMPOTENT = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+# How a kept-alive connection closed by the other end while idle fails on reuse
+STALE_ERRNOS = frozenset([errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED])
+
+config = {}
+
+_pools = {} # (scheme, host, port) -> _HostPool
+_pools_lock = threading.Lock()
+_cache = OrderedDict() # (url, params) -> (expires, Response), oldest first
+_cache_lock = threading.Lock()
+_threads = None
+
+logging.basicConfig()
+log = logging.getLogger(__file__)
+log.setLevel(logging.DEBUG)
+
+class OutboundError(Exception):
+    pass
+
+class Response(object):
+    status = None
+    headers = None
+    body = None
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+    def form(self):
+        """
+        Body decoded as application/x-www-form-urlencoded (as some OAuth token endpoints reply)
+        """
+        return dict(urlparse.parse_qsl(self.body))
+
+class _HostPool(object):
+    """
+    Idle keep-alive connections to one host, and a limit on requests in flight to it
+    """
+    def __init__(self, scheme, host, port):
+        self.connection_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+        self.host = host
+        self.port = port
+        self.slots = threading.BoundedSemaphore(config['max_per_host'])
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        @return: (connection, whether it was reused)
+        """
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return self.connection_class(self.host, self.port, timeout=config['timeout']), False
+
+    def release(self, connection):
+        with self.lock:
+            self.idle.append(connection)
+
+    def close(self):
+        with self.lock:
+            for connection in self.idle:
+                connection.close()
+            self.idle = []
+
+def _pool_for(scheme, host, port):
+    key = (scheme, host, port)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, _HostPool(scheme, host, port))
+    return pool
+
+def _stale(e):
+    # The other end closed the connection before any of the response arrived. A timeout never counts: the request
+    # may have been received, and is at best slow.
+    if isinstance(e, httplib.BadStatusLine):
+        return e.line in ('', "''")
+    if isinstance(e, socket.timeout):
+        return False
+    return isinstance(e, socket.error) and e.errno in STALE_ERRNOS
+
+def request(method, url, params=None, body=None, headers=None):
+    """
+    Make an HTTP request over a pooled connection. A request on a reused connection that turns out to have been
+    closed while idle is sent again on another, if its method is idempotent.
+
+    @param method:str
+    @param url:str
+    @param params:dict Query string parameters
+    @param body:str|dict Request body; a dict is form encoded
+    @param headers:dict
+    @return:Response
+    """
+    parts = urlparse.urlsplit(url)
+    path = parts.path or '/'
+    query = '&'.join(q for q in [parts.query, urllib.urlencode(params or {})] if q)
+    if query:
+        path += '?' + query
+
+    headers = dict(headers or {})
+    if isinstance(body, dict):
+        body = urllib.urlencode(body)
+        headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+
+    pool = _pool_for(parts.scheme, parts.hostname, parts.port)
+    pool.slots.acquire()
+
+    try:
+        while True:
+            connection, reused = pool.acquire()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                result = Response(response.status, dict(response.getheaders()), response.read())
+            except (httplib.HTTPException, IOError) as e:
+                connection.close()
+                # A kept-alive connection may have been closed by the other end while idle; try another
+                if reused and method in IDEMPOTENT and _stale(e):
+                    continue
+                raise OutboundError("%s %s failed: %s" % (method, url, e))
+
+            if response.will_close:
+                connection.close()
+            else:
+                pool.release(connection)
+            return result
+    finally:
+        pool.slots.release()
+
+def get(url, params=None, headers=None, cache=False):
+    """
+    GET a url. With cache, a successful response is reused for outbound.cache_ttl seconds (or cache seconds, if a
+    number is given).
+
+    @return:Response
+    """
+    if not cache:
+        return request('GET', url, params, headers=headers)
+
+    key = (url, tuple(sorted((params or {}).items())))
+    now = time.time()
+    cached = _cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    response = request('GET', url, params, headers=headers)
+    if response.status == 200:
+        ttl = config['cache_ttl'] if cache is True else cache
+        with _cache_lock:
+            _cache.pop(key, None)
+            _cache[key] = (now + ttl, response)
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    return response
+
+def post(url, body=None, headers=None):
+    """
+    POST to a url
+
+    @return:Response
+    """
+    return request('POST', url, body=body, headers=headers)
+
+def submit(f, *args, **kwargs):
+    """
+    Run an outbound call on the shared thread pool
+
+    @return: AsyncResult; .get() waits for and returns the result, or raises its exception
+    """
+    global _threads
+
+    # Started on first use; most processes never need it
+    if _threads is None:
+        with _pools_lock:
+            if _threads is None:
+                _threads = ThreadPool(config['threads'])
+    return _threads.apply_async(f, args, kwargs)
+
+def close():
+    """
+    Close all idle pooled connections
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+def init(settings):
+    """
+    Initialise outbound HTTP subsystem
+
+    @param settings:dict Outbound configuration settings (see module docs)
+    @return:
+    """
+    global _threads
+
+    config['timeout'] = settings.get('outbound.timeout', 10)
+    config['max_per_host'] = settings.get('outbound.max_per_host', 8)
+    config['cache_ttl'] = settings.get('outbound.cache_ttl', 60)
+    config['threads'] = settings.get('outbound.threads', 8)
+
+    close()
+    if _threads is not None:
+        _threads.close()
+    _threads = None
+
+def after_fork():
+    """
+    Reset in a forked worker: pooled connections and locks inherited from the parent are dropped, as is the thread
+    pool, whose threads did not survive the fork.
+
+    @return:
+    """
+    global _pools_lock, _cache_lock, _threads
+
+    _pools_lock = threading.Lock()
+    _cache_lock = threading.Lock()
+    close()
+    _threads = None
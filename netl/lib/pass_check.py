@@ -407,12 +407,9 @@ prayer
 hotdog
 """
 
-def match(p):
-    pset = set()
-    for password in passwords.split('\n'):
-        pset.add(password.strip())
+# Built once at import, so a preforking server builds it in the master and every worker shares it
+pset = frozenset(password.strip() for password in passwords.split('\n'))
 
-    if p in pset:
-        return True
-    return False
+def match(p):
+    return p in pset
 
@@ -0,0 +1,185 @@
+"""
+
+Prefork server
+
+The master process binds the listening socket, loads the application, and forks workers. Each worker accepts on the
+shared socket and serves one request at a time. Everything the master loaded before forking (modules, the route table,
+compiled templates, the password list) is shared copy-on-write between workers. Connections and threads are not safe
+to share, so each worker calls the after_fork hooks first thing.
+
+A worker exits after max_requests requests, which guards against slow leaks, and the master starts a replacement.
+SIGHUP reloads gracefully: the master calls load() again for a fresh application and replaces every worker, and each
+old worker finishes its current request before exiting. SIGTERM or SIGINT stops the server.
+
+Usage
+
+from netl.lib import prefork
+
+prefork.serve(lambda: make_app(settings), host='127.0.0.1', port=8080, workers=4,
+              after_fork=[db.after_fork, ...], before_exit=[popularity.shutdown])
+
+"""
+import errno
+import logging
+import os
+import select
+import signal
+import socket
+import time
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+logging.basicConfig()
+log = logging.getLogger(__file__)
+log.setLevel(logging.DEBUG)
+
+class _Handler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        # Requests are recorded by the event log
+        pass
+
+class _Server(WSGIServer):
+    served = 0
+
+    def finish_request(self, request, client_address):
+        self.served += 1
+        WSGIServer.finish_request(self, request, client_address)
+
+def _listen(host, port, backlog):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    # Every idle worker wakes for a new connection and only one wins the accept; the rest must not block in accept()
+    listener.setblocking(0)
+    return listener
+
+def _worker(app, listener, max_requests, after_fork, before_exit):
+    """
+    Serve requests in a forked worker until told to stop or max_requests is reached
+    """
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGHUP, stop)
+    signal.signal(signal.SIGTERM, stop)
+    # ^C goes to the whole process group; leave it to the master to stop workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    for hook in after_fork:
+        hook()
+
+    server = _Server(listener.getsockname(), _Handler, bind_and_activate=False)
+    server.socket = listener
+    server.server_name = socket.getfqdn(listener.getsockname()[0])
+    server.server_port = listener.getsockname()[1]
+    server.setup_environ()
+    server.set_app(app)
+
+    # Wait with a timeout so a stop is noticed within a second even when idle. (handle_request() would take its
+    # timeout from the non-blocking listener, which is zero.)
+    while not stopping and server.served < max_requests:
+        try:
+            readable = select.select([listener], [], [], 1)[0]
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            continue
+        if readable:
+            # Another worker may win the accept; that's handled as a failed request and ignored
+            server._handle_request_noblock()
+
+    for hook in before_exit:
+        try:
+            hook()
+        except Exception:
+            log.exception("Worker %d exit hook failed" % os.getpid())
+
+def _spawn(app, listener, max_requests, after_fork, before_exit):
+    pid = os.fork()
+    if pid:
+        return pid
+
+    status = 0
+    try:
+        _worker(app, listener, max_requests, after_fork, before_exit)
+    except Exception:
+        log.exception("Worker %d failed" % os.getpid())
+        status = 1
+    # Never return into the master's stack or run its exit handlers
+    os._exit(status)
+
+def serve(load, host='127.0.0.1', port=8080, workers=4, max_requests=10000, backlog=128, after_fork=(),
+          before_exit=()):
+    """
+    Serve a WSGI application from forked worker processes until stopped
+
+    @param load: Function returning the WSGI application; called at startup and again on SIGHUP
+    @param host:str
+    @param port:int
+    @param workers:int Worker processes
+    @param max_requests:int Requests a worker serves before it is replaced
+    @param backlog:int Listen queue length
+    @param after_fork: Functions called in each worker before it serves anything
+    @param before_exit: Functions called in each worker as it exits
+    @return:
+    """
+    listener = _listen(host, port, backlog)
+    app = load()
+    children = set()
+    signals = []
+
+    def note(signum, frame):
+        signals.append(signum)
+
+    for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, note)
+
+    log.info("Serving on http://%s:%d with %d workers" % (host, port, workers))
+
+    try:
+        while True:
+            while signals:
+                signum = signals.pop(0)
+                if signum != signal.SIGHUP:
+                    return
+
+                try:
+                    app = load()
+                except Exception:
+                    log.exception("Reload failed; keeping the current application")
+                    continue
+
+                log.info("Reloading %d workers" % len(children))
+                for pid in children:
+                    os.kill(pid, signal.SIGHUP)
+
+            # Start replacements for workers that exited, including any stopped by a reload
+            while len(children) < workers:
+                children.add(_spawn(app, listener, max_requests, after_fork, before_exit))
+
+            try:
+                pid, status = os.wait()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            children.discard(pid)
+            if status:
+                log.warn("Worker %d exited with status %d" % (pid, status))
+                # Don't respawn in a tight loop if workers fail at startup
+                time.sleep(1)
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        listener.close()
@@ -0,0 +1,211 @@
+"""
+
+Rate limiting
+
+Limits how often a view may be called, per client IP, per request parameter (such as username) and overall, and
+rejects excess calls before the view does any work. Intended for views that are expensive to call, such as local
+authentication and sign-up which each hash a password.
+
+Each rule is a rate: at most `rate` calls per `per` seconds, with bursts of up to `rate`. Limits are kept per view,
+so calls to one limited view don't count against another. The memory backend keeps a token bucket per key in this
+process, holding at most MAX_BUCKETS keys (least recently used are dropped). The mongodb backend shares limits between
+processes and nodes using a sliding window approximated from two fixed windows. Either way, only allowed calls count:
+a client that keeps calling while limited is not held off any longer for it.
+
+Configuration
+
+ratelimit.backend         'memory' (default) or 'mongodb'
+ratelimit.mongodb_url     MongoDB url (mongodb backend)
+ratelimit.mongodb_db      MongoDB database (mongodb backend)
+
+Usage
+
+from netl.lib import ratelimit
+
+@ratelimit.limit(ratelimit.by_ip(10, 60), ratelimit.by_param('username', 5, 60))
+def authenticate(request):
+    # ... hash the password etc
+
+A rejected call raises RateLimitedException.
+
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import logging
+import threading
+import time
+from decorator import decorator
+import pymongo
+
+MAX_BUCKETS = 100000
+
+config = {}
+backend = None
+
+logging.basicConfig()
+log = logging.getLogger(__file__)
+log.setLevel(logging.DEBUG)
+
+class RateLimitedException(Exception):
+    pass
+
+class Rule(object):
+    name = None # Distinguishes the rule's keys from those of other rules
+    rate = None # Calls allowed...
+    per = None # ...per this many seconds
+    key = None # Function of the request giving the key to limit by, or None to not limit this request
+
+    def __init__(self, name, rate, per, key):
+        self.name = name
+        self.rate = rate
+        self.per = per
+        self.key = key
+
+def by_ip(rate, per):
+    """
+    Limit calls per client IP address
+
+    @param rate:int
+    @param per:int Seconds
+    @return:Rule
+    """
+    return Rule('ip', rate, per, lambda request: request.client_addr)
+
+def by_param(name, rate, per):
+    """
+    Limit calls per value of a request parameter, for example the username being authenticated
+
+    @param name:str Parameter name
+    @param rate:int
+    @param per:int Seconds
+    @return:Rule
+    """
+    return Rule('param.%s' % name, rate, per, lambda request: request.params.get(name))
+
+def by_session(rate, per):
+    """
+    Limit calls per session
+
+    @param rate:int
+    @param per:int Seconds
+    @return:Rule
+    """
+    return Rule('session', rate, per, lambda request: request.session.id)
+
+def overall(rate, per):
+    """
+    Limit calls overall
+
+    @param rate:int
+    @param per:int Seconds
+    @return:Rule
+    """
+    return Rule('all', rate, per, lambda request: '')
+
+class MemoryBackend(object):
+    """
+    Token buckets in this process
+    """
+    def __init__(self):
+        self._buckets = OrderedDict() # key -> (tokens, last update), least recently used first
+        self._lock = threading.Lock()
+
+    def hit(self, key, rate, per):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (rate, now))
+            tokens = min(rate, tokens + (now - updated) * rate / float(per))
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+
+            while len(self._buckets) > MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+
+        return allowed
+
+class MongoBackend(object):
+    """
+    Sliding window counters shared through MongoDB
+    """
+    def __init__(self, store):
+        self._store = store
+        self._store.ratelimit.ensure_index('expires', expireAfterSeconds=0)
+
+    def hit(self, key, rate, per):
+        now = time.time()
+        window = int(now // per)
+        elapsed = (now % per) / per
+
+        current = self._store.ratelimit.find_and_modify(
+            {'_id': '%s:%d' % (key, window)},
+            {'$inc': {'count': 1}, '$set': {'expires': datetime.utcnow() + timedelta(seconds=2*per)}},
+            upsert=True, new=True)
+        previous = self._store.ratelimit.find_one({'_id': '%s:%d' % (key, window - 1)})
+
+        # Weight the previous window by how much of it still falls within the sliding window
+        count = current['count'] + (previous['count'] * (1 - elapsed) if previous else 0)
+        if count > rate:
+            # Rejected calls don't count, as with the memory backend
+            self._store.ratelimit.update({'_id': current['_id']}, {'$inc': {'count': -1}})
+            return False
+        return True
+
+def limit(*rules):
+    """
+    Decorator that rejects the request with RateLimitedException if any of the rules is exceeded
+
+    @param rules: Rule instances
+    @return:
+    """
+    def limit(f, request):
+        view = '%s.%s' % (f.__module__, f.__name__)
+        for rule in rules:
+            key = rule.key(request)
+            if key is None:
+                continue
+
+            if not _backend().hit('%s:%s:%s' % (view, rule.name, key), rule.rate, rule.per):
+                log.warn("Rate limit %s exceeded for %s" % (rule.name, key))
+                raise RateLimitedException()
+
+        return f(request)
+    return decorator(limit)
+
+def init(settings):
+    """
+    Initialise rate limiting subsystem
+
+    @param settings:dict Rate limit configuration settings (see module docs)
+    @return:
+    """
+    global backend
+
+    config['backend'] = settings.get('ratelimit.backend', 'memory')
+
+    config['mongodb_url'] = settings.get('ratelimit.mongodb_url')
+    config['mongodb_db'] = settings.get('ratelimit.mongodb_db')
+
+    backend = None
+
+def _backend():
+    global backend
+
+    # Created on first use, so the mongodb backend connects in the process that needs it
+    if backend is None:
+        if config['backend'] == 'mongodb':
+            backend = MongoBackend(pymongo.Connection(config['mongodb_url'])[config['mongodb_db']])
+        else:
+            backend = MemoryBackend()
+    return backend
+
+def after_fork():
+    """
+    Drop the backend in a forked worker. A memory backend starts again empty, so each worker holds its own buckets.
+
+    @return:
+    """
+    global backend
+
+    backend = None
@@ -0,0 +1,175 @@
+"""
+
+JSON renderer
+
+Replaces Pyramid's stock json renderer. Views can return SQLAlchemy rows, datetimes, dates, Decimals and ObjectIds
+as they are, with no str() conversions. Datetimes are written as str() writes them (2012-03-01 10:00:00). Encoding
+uses the standard library json module when it has its C encoder, which measured faster than simplejson's for our
+payloads (json_render_bench.py). Otherwise simplejson is used if it is installed, and pure Python json if not.
+
+For long lists, stream() returns a response that encodes its items as they are iterated, so the whole document is
+never built at once. Rows in a stream are encoded by precompiled row encoders. For each distinct set of keys, a
+function is compiled once. It holds a template with the keys already encoded, and for each column it calls an encoder
+picked from the type of that column's value in the first row (for strings and integers, the C functions directly). A
+row whose values don't suit those encoders (a NULL, say) goes through the generic path instead.
+
+Usage
+
+config.add_renderer('json', renderer.factory)
+
+@view_config(route_name='item.get', renderer='json')
+def get(request):
+    return {'date': item['dated'], ...}
+
+@view_config(route_name='item.list')
+def list_items(request):
+    return renderer.stream(rows, trailer=lambda last: {'next': ...})
+
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from bson.objectid import ObjectId
+from pyramid.response import Response
+import json
+if json.encoder.c_make_encoder is None:
+    try:
+        import simplejson as json
+    except ImportError:
+        pass
+encode_basestring_ascii = json.encoder.encode_basestring_ascii
+
+BACKEND = json.__name__
+# Rows encoded per chunk of a stream
+STREAM_CHUNK = 64
+
+_row_encoders = {} # keys -> compiled row encoder
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    # SQLAlchemy rows, and other mappings
+    if hasattr(value, 'keys'):
+        return dict(zip(value.keys(), value.values() if isinstance(value, dict) else value))
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+_encoder = json.JSONEncoder(default=_default, separators=(', ', ': '))
+
+def encode(value):
+    """
+    Encode a value as JSON
+
+    @return:str
+    """
+    return _encoder.encode(value)
+
+def _encode_value(value):
+    # The common column types directly; anything else through the encoder
+    kind = type(value)
+    if kind is unicode or kind is str:
+        return encode_basestring_ascii(value)
+    if kind is int or kind is long:
+        return str(value)
+    if value is None:
+        return 'null'
+    if kind is datetime:
+        return '"%s"' % value.isoformat(' ')
+    return _encoder.encode(value)
+
+def _encode_datetime(value):
+    return '"%s"' % value.isoformat(' ')
+
+# Each raises TypeError or AttributeError when given a value of another type
+_column_encoders = {
+    str: encode_basestring_ascii,
+    unicode: encode_basestring_ascii,
+    int: int.__str__,
+    long: long.__str__,
+    datetime: _encode_datetime,
+}
+
+def _row_template(keys):
+    return '{%s}' % ', '.join('%s: %%s' % encode_basestring_ascii(key).replace('%', '%%') for key in keys)
+
+def _compile_row_encoder(keys, values):
+    namespace = {'template': _row_template(keys)}
+    calls = []
+    for n, value in enumerate(values):
+        namespace['e%d' % n] = _column_encoders.get(type(value), _encode_value)
+        calls.append('e%d(v%d)' % (n, n))
+    source = 'def encode_row(%s):\n    return template %% (%s,)\n' % (
+        ', '.join('v%d' % n for n in range(len(calls))), ', '.join(calls))
+    exec(source, namespace)
+    return namespace['encode_row']
+
+def encode_row(row):
+    """
+    Encode a row (or a dict) as a JSON object, using the encoder compiled for its keys
+
+    @return:str
+    """
+    if isinstance(row, dict):
+        keys = tuple(row)
+        values = [row[key] for key in keys]
+    else:
+        keys = tuple(row.keys())
+        values = row
+
+    encoder = _row_encoders.get(keys)
+    if encoder is None:
+        encoder = _row_encoders[keys] = _compile_row_encoder(keys, values)
+    try:
+        return encoder(*values)
+    except (TypeError, AttributeError):
+        return _row_template(keys) % tuple([_encode_value(value) for value in values])
+
+def _stream(items, name, convert, trailer):
+    chunk = ['{%s: [' % encode_basestring_ascii(name)]
+    last = empty = object()
+    for item in items:
+        if last is not empty:
+            chunk.append(', ')
+        chunk.append(encode_row(convert(item) if convert else item))
+        last = item
+        if len(chunk) >= STREAM_CHUNK * 2:
+            yield ''.join(chunk)
+            chunk = []
+
+    chunk.append(']')
+    if trailer:
+        for key, value in trailer(None if last is empty else last).items():
+            chunk.append(', %s: %s' % (encode_basestring_ascii(key), encode(value)))
+    chunk.append('}')
+    yield ''.join(chunk)
+
+def stream(items, name='items', convert=None, trailer=None):
+    """
+    A response encoding a list as it is iterated: {name: [items...], trailer fields...}
+
+    @param items: iterable of rows or dicts
+    @param name:str Key of the list
+    @param convert: Function applied to each item before encoding
+    @param trailer: Function of the last item (before convert, None if there were none) returning a dict of fields to
+                    add after the list; for fields only known at the end, such as a cursor for the next page
+    @return: Response
+    """
+    return Response(app_iter=_stream(items, name, convert, trailer), content_type='application/json',
+                    charset='utf-8')
+
+def factory(info):
+    """
+    Renderer factory, for config.add_renderer()
+    """
+    def render(value, system):
+        request = system.get('request')
+        if request is not None:
+            response = request.response
+            if response.content_type == response.default_content_type:
+                response.content_type = 'application/json'
+        return encode(value)
+    return render
@@ -9,17 +9,48 @@ This session implementation utilises a MongoDB backend to provide the following:
     Base64 encoding alphabet as their session ID.
 
 2. Revocation
-    Sessions can be revoked (expired) on an individual basis via .expire(), or as a group via .expire_set() in
-    order to kill all sessions relating to a particular user (necessary for credentials changes)
+    Sessions can be revoked (expired) on an individual basis via .expire(), or as a group via .expire_user() in
+    order to kill all sessions relating to a particular user (necessary for credentials changes).
+
+    Group revocation works on credential epochs. Each user has an epoch counter, and a session records the epoch
+    of each user bound to it via .bind_users(). Revoking a user's sessions bumps their epoch, a single small write
+    however many sessions they have; sessions issued under an older epoch are refused when next loaded. Epoch
+    lookups are cached for session.epoch_cache_ttl seconds, so a revocation may take that long to reach other
+    processes.
 
 3. Upgrades
     When a session crosses a permissions boundary (Login, Administration, HTTPS), the .rotate() method can be called to
     expire the old session ID and move the data into a new one.
 
+    Sessions are also rotated automatically once their ID is older than session.lifetime seconds or has been used
+    for session.max_requests requests. Rotation happens at save time as a single update that moves the stored session
+    to its new ID. Automatic rotations leave the old ID usable for session.rotate_grace seconds, so that concurrent
+    requests from the same browser still carrying it follow the session to its new ID instead of losing it.
+    Rotations at a permissions boundary get no grace period.
+
 4. Idle detection
     When a session has been idle for session.timeout seconds it is expired automatically.
 
-5. Secure by default
+5. Administration
+    Sessions carry their real and actor user ids as indexed top-level fields, maintained by .set_owner(), so a
+    user's active sessions can be listed, counted and killed in bulk (list_for_user(), count_for_user(),
+    expire_for_user()). compute_active_counts() summarises active sessions per user for dashboards and is meant
+    to be run periodically in the background (see session_stats.py).
+
+6. Sharding
+    Sessions, CSRF tokens and credential epochs can be spread over several MongoDB instances by listing them in
+    session.mongodb_urls. Each session lives on the node its token hashes to on a consistent hash ring (CSRF tokens by
+    their rotation-independent CSRF id, epochs by user id), so adding a node only moves the keys that now belong on it.
+    Group operations fan out to every node in parallel.
+
+    Adding a node takes three steps, so that no process ever looks for a session where it isn't:
+    1. rebalance_copy(): copy the documents that will belong on the new node onto it, leaving the originals.
+    2. Add the node to session.mongodb_urls and reload every process (SIGHUP to the prefork master).
+    3. rebalance_prune(): bring over anything written on the old nodes since the copy (by processes still on the old
+       list), then delete the originals. Run it promptly: until then, changes made by old processes are not seen
+       by new ones.
+
+7. Secure by default
     Where possible, the interface offers secure defaults and provides an API that makes it clear what methods should
     be called where in your code in order to operate securely.
 
@@ -30,9 +61,13 @@ session.path            Path to limit session to
 session.timeout         Session idle timeout (Recommend no more than 20 minutes, probably 10)
 session.secure_only     True if you want HTTPS only
 session.csrf_lifetime   Lifetime (in seconds) of any given CSRF token. Recommend 10 minutes
-session.lifetime        Lifetime of any single session ID before it is auto-rotated
+session.lifetime        Lifetime (in seconds) of any single session ID before it is auto-rotated (default: never)
+session.max_requests    Number of requests any single session ID serves before it is auto-rotated (default: never)
+session.rotate_grace    Seconds the old ID of an auto-rotated session remains usable (default 30)
+session.epoch_cache_ttl Seconds a user's credential epoch is cached for (default 5)
 session.mongodb_url     MongoDB url
-session.mongodb_db      MongoDB database
+session.mongodb_urls    MongoDB urls to shard across, as a list or comma-separated (instead of session.mongodb_url)
+session.mongodb_db      MongoDB database (the same name on every shard)
 
 
 Scenario usage
@@ -58,7 +93,8 @@ Password change (must expire all other sessions for this user since they no long
 def set_password(request):
     # ... save password to database etc
     actor_id = request.session['actor_id']
-    request.session.expire_set({'actor_id': actor_id})
+    request.session.expire_user(actor_id)
+    request.session.bind_users(actor_id)
     request.session.rotate()
 
 Credentials upgrade (or moving to HTTPS)
@@ -67,6 +103,15 @@ def login():
     # ... check user/pass as given etc here
     request.session.rotate()
     request.session['actor_id'] = actor_id
+    request.session.bind_users(actor_id)
+
+Listing and killing a user's sessions (admin)
+
+def sessions(request):
+    return {'sessions': session.list_for_user(user_id)}
+
+def kill_sessions(request):
+    session.expire_for_user(user_id)
 
 Protected form generation.
 
@@ -94,11 +139,22 @@ features above this.
 """
 from datetime import datetime, timedelta
 import logging
+import threading
+import time
 import pymongo
+from bson.objectid import ObjectId
+from netl.lib.shard import HashRing, parallel
 from netl.lib.token import create_token, valid_token
 
 config = {}
-mongodb = None
+ring = None # Consistent hash ring of session store databases
+
+EPOCH_CACHE_SIZE = 10000
+_epoch_cache = {} # user id -> (epoch, time fetched)
+_epoch_lock = threading.Lock()
+
+# Allowance for clocks differing between hosts, when rebalancing decides whether a CSRF token predates a copy
+CLOCK_SKEW = timedelta(seconds=5)
 
 logging.basicConfig()
 log = logging.getLogger(__file__)
@@ -107,12 +163,61 @@ log.setLevel(logging.DEBUG)
 class InvalidCSRFToken(Exception):
     pass
 
+def _ring():
+    global ring
+
+    # Shards are connected on first use rather than in init(), so configuring the app costs nothing and a forked
+    # worker makes its own connections
+    if ring is None:
+        connected = HashRing([(url, pymongo.Connection(url)[config['mongodb_db']]) for url in config['mongodb_urls']])
+        connected.fan_out(_ensure_indexes)
+        ring = connected
+    return ring
+
+def _sessions(session_id):
+    return _ring().node_for(session_id).session
+
+def _csrf(csrf_id):
+    return _ring().node_for(csrf_id).csrf
+
+def _epoch_store(user_id):
+    return _ring().node_for('epoch:%s' % user_id).epoch
+
+def _fetch_epoch(user_id):
+    doc = _epoch_store(user_id).find_one({'_id': user_id})
+    epoch = doc['epoch'] if doc else 0
+    _cache_epoch(user_id, epoch)
+    return epoch
+
+def _cache_epoch(user_id, epoch):
+    with _epoch_lock:
+        if len(_epoch_cache) >= EPOCH_CACHE_SIZE:
+            _epoch_cache.clear()
+        _epoch_cache[user_id] = (epoch, time.time())
+
+def _bump_epoch(user_id):
+    doc = _epoch_store(user_id).find_and_modify({'_id': user_id}, {'$inc': {'epoch': 1}}, upsert=True, new=True)
+    _cache_epoch(user_id, doc['epoch'])
+
+def _current_epoch(user_id):
+    cached = _epoch_cache.get(user_id)
+    if cached and time.time() - cached[1] < config['epoch_cache_ttl']:
+        return cached[0]
+    return _fetch_epoch(user_id)
+
 class Session(dict):
     id = None # Session ID
     modified = None # Has the session data been modified?
     expired = None # Is the session expired?
-    _store = None # Rotation-independent ID to tie to CSRF tokens
-    _csrf_id = None
+    _csrf_id = None # Rotation-independent ID to tie to CSRF tokens
+    _epochs = None # [user id, credential epoch] for each user bound to the session
+    real_id = None # Real user the session belongs to, if any
+    actor_id = None # User the session is acting as, if any
+    issued = None # When the current session ID was issued
+    requests = None # Requests served under the current session ID
+    _stored = None # Does the store hold this session yet?
+    _rotated_from = None # Stored ID being rotated away from, until saved
+    _grace = None # Seconds the rotated-from ID remains usable
 
     def __init__(self, request):
         dict.__init__(self)
@@ -120,9 +225,8 @@ class Session(dict):
         self.request = request
         self.modified = False
         self.expired = False
+        self._stored = False
 
-        self._store = mongodb[config['mongodb_db']]
-        
         self.id = str(request.str_cookies.get(config['name'], None))
 
         # Did we find a session ID in the cookie?
@@ -137,7 +241,12 @@ class Session(dict):
             self.reset()
             return
 
-        doc = self._store.session.find_one({'session_id': self.id})
+        doc = _sessions(self.id).find_one({'$or': [{'session_id': self.id},
+                                                   {'previous_id': self.id, 'grace_until': {'$gt': datetime.now()}}]})
+
+        # Was it recently rotated onto another shard? Follow it there
+        if doc and doc.get('moved_to') and doc['grace_until'] > datetime.now():
+            doc = _sessions(doc['moved_to']).find_one({'session_id': doc['moved_to']})
 
         # Did we find the session ID in the store?
         if not doc:
@@ -145,6 +254,11 @@ class Session(dict):
             self.reset()
             return
 
+        # Was it recently rotated by another request? Follow it to its new ID
+        if doc['session_id'] != self.id:
+            log.debug("Following rotated session %s to %s" % (self.id, doc['session_id']))
+            self.id = doc['session_id']
+
         # Has this session been forcibly expired?
         self.last_update = doc['last_update']
         if doc.get('expired',False):
@@ -161,11 +275,25 @@ class Session(dict):
             self.reset()
             return
 
+        # Have the credentials of any bound user been revoked since the session was issued?
+        for user_id, epoch in doc.get('epochs', []):
+            if _current_epoch(user_id) > epoch:
+                log.warn("Attempt to use session with revoked credentials")
+                self.expire()
+                self.reset()
+                return
+
         # Map the data into the dictionary
         for k in doc['data'].keys():
             self[k] = doc['data'][k]
 
         self._csrf_id = doc['csrf_id']
+        self._epochs = doc.get('epochs', [])
+        self.real_id = doc.get('real_id')
+        self.actor_id = doc.get('actor_id')
+        self.issued = doc.get('issued', self.last_update)
+        self.requests = doc.get('requests', 0) + 1
+        self._stored = True
 
         self.modified = False
 
@@ -181,7 +309,14 @@ class Session(dict):
         self.modified = True
         self.expired = False
         self._csrf_id = create_token()
+        self._epochs = []
+        self.real_id = None
+        self.actor_id = None
         self.last_update = datetime.now()
+        self.issued = self.last_update
+        self.requests = 1
+        self._stored = False
+        self._rotated_from = None
         self.clear()
 
     def __setitem__(self, k, value):
@@ -198,7 +333,9 @@ class Session(dict):
         be able to retrieve it.
         """
         log.debug("Expiring session %s" % self.id)
-        self._store.session.update({'session_id': self.id}, {'$set': {'expired': True}})
+        stored_id = self._rotated_from or self.id
+        _sessions(stored_id).update({'session_id': stored_id}, {'$set': {'expired': True}})
+        self._rotated_from = None
         self.expired = True
 
     def expire_set(self, match):
@@ -206,28 +343,79 @@ class Session(dict):
         Expires a set of matching settings. For example,
 
         session.expire_set({'data.user_id': 55})
+
+        This scans every shard for matches; to expire all sessions for a user, use expire_user() instead.
         """
-        self._store.session.update(match, {'$set': {'expired': True}})
+        _ring().fan_out(lambda store: store.session.update(match, {'$set': {'expired': True}}, multi=True))
         self.expired = True
 
-    def rotate(self):
+    def expire_user(self, user_id):
+        """
+        Expires every session bound to the given user, as either real or actor, by bumping their credential
+        epoch. Includes this session; re-bind it with bind_users() if it should survive.
+        """
+        log.debug("Revoking sessions for user %s" % user_id)
+        _bump_epoch(user_id)
+
+    def bind_users(self, *user_ids):
+        """
+        Record the current credential epoch of each user against this session, so that expire_user() on any of
+        them revokes it. Replaces any previously bound users. Should be called whenever the session's identity is
+        set or changed.
+        """
+        self._epochs = [[user_id, _fetch_epoch(user_id)] for user_id in user_ids if user_id]
+        self.modified = True
+
+    def set_owner(self, real_id, actor_id):
+        """
+        Record the real and actor users this session belongs to, and bind the session to their credentials.
+        """
+        self.real_id = real_id
+        self.actor_id = actor_id
+        self.bind_users(real_id, actor_id)
+
+    def rotate(self, grace=0):
         """
         Rotate the session. Expires the existing session ID then creates a new one, while retaining the existing
         data. Rotation of the session does not invalidate active CSRF tokens associated with the session.
 
-        New session is not saved until the end of the request.
+        The old ID is retired and the new one stored in a single update when the session is saved at the end of the
+        request. With a grace period, the old ID continues to lead to the session for that many seconds; never use
+        one when rotating across a permissions boundary.
         """
         log.debug("Rotating session %s out" % self.id)
 
-        # Expire current session
-        if not self.expired:
-            self.expire()
+        # An expired session is left as it is; the data moves to a new stored session
+        if self.expired:
+            self._stored = False
+        elif self._stored and not self._rotated_from:
+            self._rotated_from = self.id
+
+        # Retain the shortest grace of any rotation this request
+        if self._rotated_from:
+            self._grace = min(grace, self._grace) if self._grace is not None else grace
 
         # Create new session ID
         self.id = create_token()
+        self.issued = datetime.now()
+        self.requests = 1
         self.modified = True
         self.expired = False
 
+    def due_rotation(self):
+        """
+        Has the current session ID reached its configured lifetime or request limit?
+        """
+        if config['lifetime']:
+            age = datetime.now() - self.issued
+            if age.days * (24*60*60) + age.seconds >= config['lifetime']:
+                return True
+
+        if config['max_requests'] and self.requests >= config['max_requests']:
+            return True
+
+        return False
+
     def save(self):
         """
         Save the current session information to store. Done automatically when the request completes.
@@ -237,22 +425,75 @@ class Session(dict):
             return
         
         log.debug("Saving session %s to store" % self.id)
-        d = dict(self)
 
         self.last_update = datetime.now()
-        self._store.session.update({'session_id': self.id}, {'$set': {
+        fields = {
             'last_update': self.last_update,
             'session_id': self.id,
             'csrf_id': self._csrf_id,
+            'epochs': self._epochs,
+            'real_id': self.real_id,
+            'actor_id': self.actor_id,
+            'issued': self.issued,
+            'requests': self.requests,
             'data': dict(self)
-            }}, upsert=True)
+            }
+
+        if not self._stored:
+            _sessions(self.id).update({'session_id': self.id}, {'$set': fields}, upsert=True)
+            self._stored = True
+            return
+
+        # Rotation moves the stored session to its new ID, retiring the old one in the same update
+        stored_id = self._rotated_from or self.id
+        grace_until = self.last_update + timedelta(seconds=self._grace) if self._grace else None
+        self._rotated_from = None
+        self._grace = None
+
+        if stored_id != self.id and _ring().name_for(stored_id) != _ring().name_for(self.id):
+            self._move(stored_id, fields, grace_until)
+            return
+
+        if stored_id != self.id:
+            fields['previous_id'] = stored_id if grace_until else None
+            fields['grace_until'] = grace_until
+
+        result = _sessions(stored_id).update({'session_id': stored_id, 'expired': {'$ne': True}}, {'$set': fields}, safe=True)
+        if result['n']:
+            return
+
+        # Another request from the same browser rotated the session first; follow it to its new ID
+        doc = _sessions(stored_id).find_one({'$or': [{'previous_id': stored_id}, {'session_id': stored_id, 'moved_to': {'$ne': None}}],
+                                             'grace_until': {'$gt': self.last_update}})
+        if not doc or (not doc.get('moved_to') and doc.get('expired')):
+            log.warn("Not saving session %s - no longer in store" % self.id)
+            self.expired = True
+            return
+
+        self.id = fields['session_id'] = doc.get('moved_to') or doc['session_id']
+        log.debug("Saving session into %s, rotated concurrently from %s" % (self.id, stored_id))
+        fields.pop('previous_id', None)
+        fields.pop('grace_until', None)
+        _sessions(self.id).update({'session_id': self.id, 'expired': {'$ne': True}}, {'$set': fields})
+
+    def _move(self, stored_id, fields, grace_until):
+        """
+        Rotation onto a different shard: write the session under its new ID and retire the old document, which
+        points to the new ID for the grace period, if any. Both writes go out in parallel.
+        """
+        retire = {'expired': True}
+        if grace_until:
+            retire.update({'moved_to': self.id, 'grace_until': grace_until})
+
+        parallel([lambda: _sessions(self.id).update({'session_id': self.id}, {'$set': fields}, upsert=True),
+                  lambda: _sessions(stored_id).update({'session_id': stored_id}, {'$set': retire})])
 
     def create_csrf_token(self, key=None):
         """
         Create a CSRF token, with an optional key (form name, page name, whatever)
         """
         token = create_token()
-        self._store.csrf.insert({
+        _csrf(self._csrf_id).insert({
             'token': token,
             'csrf_id': self._csrf_id,
             'key': key,
@@ -270,13 +511,197 @@ class Session(dict):
             log.warn("Attempt to consume CSRF token from expired session")
             raise InvalidCSRFToken()
 
-        result = self._store.csrf.find_and_modify({'csrf_id': self._csrf_id, 'token': token, 'key': key, 'dated': {'$gt': datetime.now() - timedelta(seconds=config['csrf_lifetime'])}},remove=True)
+        result = _csrf(self._csrf_id).find_and_modify({'csrf_id': self._csrf_id, 'token': token, 'key': key, 'dated': {'$gt': datetime.now() - timedelta(seconds=config['csrf_lifetime'])}},remove=True)
         if not result:
             log.warn("Attempt to consume invalid CSRF token")
             raise InvalidCSRFToken()
         log.debug("Consumed CSRF token %s" % token)
 
 
+def _active_for_user(user_id):
+    return {'$or': [{'real_id': user_id}, {'actor_id': user_id}],
+            'expired': {'$ne': True},
+            'last_update': {'$gt': datetime.now() - timedelta(seconds=config['timeout'])}}
+
+def list_for_user(user_id):
+    """
+    List the active sessions belonging to a user, as either real or actor. Sessions are identified by their
+    store id rather than their token, so the listing can't be used to hijack them.
+
+    @param user_id:
+    @return:list of dicts with id, real_id, actor_id, last_update
+    """
+    found = _ring().fan_out(lambda store: list(store.session.find(_active_for_user(user_id), fields=['real_id', 'actor_id', 'last_update'])))
+    return [{'id': str(doc['_id']), 'real_id': doc['real_id'], 'actor_id': doc['actor_id'], 'last_update': doc['last_update']}
+            for docs in found for doc in docs]
+
+def count_for_user(user_id):
+    """
+    Count the active sessions belonging to a user
+
+    @param user_id:
+    @return:int
+    """
+    return sum(_ring().fan_out(lambda store: store.session.find(_active_for_user(user_id)).count()))
+
+def expire_for_user(user_id):
+    """
+    Expire all sessions belonging to a user. Revocation itself is by credential epoch; the sessions are also
+    marked expired so they drop out of listings and counts straight away.
+
+    @param user_id:
+    @return:
+    """
+    _bump_epoch(user_id)
+    _ring().fan_out(lambda store: store.session.update(_active_for_user(user_id), {'$set': {'expired': True}}, multi=True))
+
+def expire_by_id(user_id, ids):
+    """
+    Expire specific sessions belonging to a user, identified as in list_for_user()
+
+    @param user_id:
+    @param ids:list of session ids from list_for_user()
+    @return:
+    """
+    match = {'_id': {'$in': [ObjectId(id) for id in ids]}, '$or': [{'real_id': user_id}, {'actor_id': user_id}]}
+    _ring().fan_out(lambda store: store.session.update(match, {'$set': {'expired': True}}, multi=True))
+
+def compute_active_counts():
+    """
+    Recompute the number of active sessions per (real) user into the session_count collection. Counted on the
+    server in one aggregation pass per shard; meant to be run periodically rather than per request.
+
+    @return:int Number of users with active sessions
+    """
+    computed = datetime.now()
+    pipeline = [
+        {'$match': {'real_id': {'$ne': None},
+                    'expired': {'$ne': True},
+                    'last_update': {'$gt': computed - timedelta(seconds=config['timeout'])}}},
+        {'$group': {'_id': '$real_id', 'count': {'$sum': 1}}}
+    ]
+
+    counts = {}
+    for result in _ring().fan_out(lambda store: store.session.aggregate(pipeline)):
+        for row in result['result']:
+            counts[row['_id']] = counts.get(row['_id'], 0) + row['count']
+
+    store = _ring().node_for('session_count')
+    for user_id, count in counts.items():
+        store.session_count.update({'_id': user_id}, {'$set': {'count': count, 'computed': computed}}, upsert=True)
+    store.session_count.remove({'computed': {'$ne': computed}})
+
+    return len(counts)
+
+def active_counts():
+    """
+    Active session count per user as of the last compute_active_counts() run
+
+    @return:dict user id -> count
+    """
+    return dict((doc['_id'], doc['count']) for doc in _ring().node_for('session_count').session_count.find())
+
+def _ensure_indexes(store):
+    store.session.ensure_index('session_id', unique=True)
+    store.session.ensure_index('previous_id', sparse=True)
+    store.session.ensure_index([('real_id', pymongo.ASCENDING), ('last_update', pymongo.ASCENDING)])
+    store.session.ensure_index([('actor_id', pymongo.ASCENDING), ('last_update', pymongo.ASCENDING)])
+    store.csrf.ensure_index([('csrf_id', pymongo.ASCENDING), ('token', pymongo.ASCENDING)])
+
+# Where each kind of document lives: collection, field it is found by, its key on the ring, and its version where
+# two copies can differ (the higher wins). CSRF tokens never change, but are deleted when consumed.
+_placement = [
+    ('session', 'session_id', lambda doc: doc['session_id'], lambda doc: doc.get('last_update')),
+    ('csrf', '_id', lambda doc: doc['csrf_id'], None),
+    ('epoch', '_id', lambda doc: 'epoch:%s' % doc['_id'], lambda doc: doc.get('epoch', 0)),
+]
+def rebalance_copy(name, store, ring=None):
+    """
+    Step 1 of adding a shard (see module docs): copy onto it the documents that will belong there once it is added.
+    Consistent hashing means only the share of keys claimed by the new shard (about 1/n) is copied. Nothing is
+    deleted, and every process goes on using the old shards, so this can run at any time.
+
+    @param name:str Shard name, as it will appear in session.mongodb_urls
+    @param store: database of the new shard
+    @param ring: current ring (default this process's)
+    @return:int Number of documents copied
+    """
+    ring = ring or _ring()
+    target = HashRing(list(ring.nodes.items()) + [(name, store)], ring.replicas)
+    _ensure_indexes(store)
+    # Recorded before copying: CSRF tokens created before this were copied, if they still existed
+    store.rebalance.update({'_id': name}, {'_id': name, 'started': datetime.now()}, upsert=True)
+
+    def copy(source_name, source):
+        copied = 0
+        for collection, field, key, version in _placement:
+            for doc in source[collection].find():
+                if target.name_for(key(doc)) == name:
+                    doc['copied_from'] = source_name
+                    store[collection].update({field: doc[field]}, doc, upsert=True)
+                    copied += 1
+        return copied
+
+    copied = sum(parallel([lambda n=n, source=source: copy(n, source) for n, source in ring.nodes.items()]))
+    log.debug("Copied %d documents onto new shard %s" % (copied, name))
+    return copied
+
+def rebalance_prune(ring=None):
+    """
+    Step 3 of adding a shard (see module docs), once every process uses the new node list: bring onto their owners
+    the documents written on the old shards since the copy (newer versions win), drop copies of CSRF tokens consumed
+    since, and delete every document from the shards it no longer belongs on.
+
+    @param ring: ring including the new shard (default this process's)
+    @return:int Number of documents deleted from shards they no longer belong on
+    """
+    ring = ring or _ring()
+    started = {}
+    for node in ring.nodes.values():
+        for doc in node.rebalance.find():
+            started[doc['_id']] = doc['started']
+
+    # A copied token gone from where it was copied from was consumed there; it must not be usable here either
+    for name in started:
+        tokens = ring.nodes[name].csrf
+        for doc in tokens.find({'copied_from': {'$ne': None}}):
+            source = ring.nodes.get(doc['copied_from'])
+            if source is not None and not source.csrf.find_one({'_id': doc['_id']}):
+                tokens.remove({'_id': doc['_id']})
+
+    def prune(source_name, source):
+        pruned = 0
+        for collection, field, key, version in _placement:
+            for doc in source[collection].find():
+                owner_name = ring.name_for(key(doc))
+                if owner_name == source_name:
+                    continue
+
+                owner = ring.nodes[owner_name][collection]
+                current = owner.find_one({field: doc[field]})
+                if current is None:
+                    # Written since the copy; a CSRF token from before it was copied, so is missing because consumed
+                    if version is not None or doc['dated'] >= started.get(owner_name, datetime.min) - CLOCK_SKEW:
+                        owner.update({field: doc[field]}, doc, upsert=True)
+                elif version is not None and version(doc) > version(current):
+                    owner.update({field: doc[field]}, doc)
+
+                source[collection].remove({'_id': doc['_id']})
+                pruned += 1
+        return pruned
+
+    pruned = sum(parallel([lambda n=n, source=source: prune(n, source) for n, source in ring.nodes.items()]))
+
+    for name in started:
+        for collection, field, key, version in _placement:
+            ring.nodes[name][collection].update({'copied_from': {'$ne': None}}, {'$unset': {'copied_from': 1}},
+                                                multi=True)
+        ring.nodes[name].rebalance.remove({'_id': name})
+
+    log.debug("Pruned %d documents from shards they no longer belong on" % pruned)
+    return pruned
+
+
 def on_request(event):
     """
     Decorate request with session
@@ -291,7 +716,8 @@ def on_response(event):
     @param event:
     @return:
     """
-    # TODO: rotate the session if it's old enough (timeout or possibly seen enough requests)
+    if not event.request.session.expired and event.request.session.due_rotation():
+        event.request.session.rotate(grace=config['rotate_grace'])
 
     event.request.session.save()
 
@@ -312,7 +738,7 @@ def init(settings):
     @param settings:dict Session configuration settings (see module docs)
     @return:
     """
-    global mongodb
+    global ring
 
     config['domain'] = settings.get('session.domain', None)
     config['path'] = settings.get('session.path')
@@ -320,6 +746,26 @@ def init(settings):
     config['timeout'] = settings.get('session.timeout')
     config['secure_only'] = settings.get('session.secure_only')
     config['csrf_lifetime'] = settings.get('session.csrf_lifetime', 10*60)
-
-    mongodb = pymongo.Connection(settings.get('session.mongodb_url'))
+    config['epoch_cache_ttl'] = settings.get('session.epoch_cache_ttl', 5)
+    config['lifetime'] = settings.get('session.lifetime', None)
+    config['max_requests'] = settings.get('session.max_requests', None)
+    config['rotate_grace'] = settings.get('session.rotate_grace', 30)
+
+    urls = settings.get('session.mongodb_urls') or [settings.get('session.mongodb_url')]
+    if isinstance(urls, basestring):
+        urls = [url.strip() for url in urls.split(',')]
+    config['mongodb_urls'] = urls
     config['mongodb_db'] = settings.get('session.mongodb_db')
+
+    ring = None
+
+def after_fork():
+    """
+    Drop shard connections in a forked worker; it reconnects on first use
+
+    @return:
+    """
+    global ring, _epoch_lock
+
+    _epoch_lock = threading.Lock()
+    ring = None
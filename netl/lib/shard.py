@@ -0,0 +1,129 @@
+"""
+
+Consistent hashing
+
+Spreads keys across a set of nodes (databases, connections, anything) such that adding or removing a node only
+moves the keys that belong on it: roughly 1/n of them, rather than nearly all of them as with hash-modulo placement.
+Each node is placed on the ring many times (replicas) to even out the share each one receives.
+
+Usage
+
+ring = shard.HashRing([('mongo-a', db_a), ('mongo-b', db_b)])
+
+ring.node_for(session_id).session.find_one(...)
+
+# Group operations run against every node in parallel
+counts = ring.fan_out(lambda db: db.session.find(match).count())
+
+"""
+from bisect import bisect, insort
+from hashlib import md5
+import threading
+
+REPLICAS = 160
+
+def _hash(key):
+    return int(md5(key).hexdigest()[:8], 16)
+
+class HashRing(object):
+    nodes = None # name -> node
+
+    def __init__(self, nodes=(), replicas=REPLICAS):
+        """
+        @param nodes: sequence of (name, node) pairs. Names decide placement, so keep them stable across restarts
+        @param replicas: points on the ring per node
+        """
+        self.nodes = {}
+        self.replicas = replicas
+        self._points = []
+        self._owners = {}
+        for name, node in nodes:
+            self.add(name, node)
+
+    def add(self, name, node):
+        """
+        Add a node to the ring
+
+        @param name:str
+        @param node:
+        @return:
+        """
+        self.nodes[name] = node
+        for i in xrange(0, self.replicas):
+            point = _hash('%s:%d' % (name, i))
+            if point not in self._owners:
+                insort(self._points, point)
+            self._owners[point] = name
+
+    def remove(self, name):
+        """
+        Remove a node from the ring
+
+        @param name:str
+        @return:
+        """
+        del self.nodes[name]
+        for i in xrange(0, self.replicas):
+            point = _hash('%s:%d' % (name, i))
+            if self._owners.get(point) == name:
+                del self._owners[point]
+                self._points.remove(point)
+
+    def name_for(self, key):
+        """
+        Name of the node that key belongs on
+
+        @param key:str
+        @return:str
+        """
+        i = bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[i]]
+
+    def node_for(self, key):
+        """
+        Node that key belongs on
+
+        @param key:str
+        @return:
+        """
+        return self.nodes[self.name_for(key)]
+
+    def fan_out(self, f):
+        """
+        Call f(node) on every node in parallel
+
+        @param f: callable
+        @return: list of results, one per node
+        """
+        return parallel([lambda node=node: f(node) for node in self.nodes.values()])
+
+def parallel(calls):
+    """
+    Run callables concurrently, one thread each, and wait for them all. If any raised, the first exception is
+    re-raised once all have finished.
+
+    @param calls: list of callables taking no arguments
+    @return: list of results, in the same order
+    """
+    if len(calls) == 1:
+        return [calls[0]()]
+
+    results = [None] * len(calls)
+    errors = []
+
+    def run(n, call):
+        try:
+            results[n] = call()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(n, call)) for n, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return results
@@ -0,0 +1,112 @@
+"""
+
+Single-flight call coalescing
+
+When several threads ask for the same thing at the same moment (a news item going viral, many tabs of one user
+arriving together) only the first actually calls through to the backend. The others wait for it and share its
+result, or its exception.
+
+Calls are only shared while one is in flight; nothing is cached afterwards. Because the result is handed to every
+waiter, decorated functions must return fully fetched, read-only values (rows, not result proxies). A waiter sees
+what the leader's transaction saw, so don't coalesce reads that must observe the caller's own uncommitted writes.
+
+Usage
+
+from netl.lib import singleflight
+
+@singleflight.coalesce()
+def get(id):
+    return db.query('select * from news where id=:id', id=id).first()
+
+singleflight.stats()
+{'netl.model.news.get': {'calls': 120, 'coalesced': 97}}
+
+"""
+import logging
+import threading
+from decorator import decorator
+
+groups = {}
+_groups_lock = threading.Lock()
+
+logging.basicConfig()
+log = logging.getLogger(__file__)
+log.setLevel(logging.DEBUG)
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class Group(object):
+    """
+    Coalesces concurrent calls that share a key
+    """
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0 # Calls made through the group
+        self.coalesced = 0 # Calls that waited on another instead of calling through
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def do(self, key, f, *args, **kwargs):
+        """
+        Call f(*args, **kwargs), unless a call for key is already in flight, in which case wait for and return its
+        result instead.
+
+        @param key: hashable identifying equivalent calls
+        @param f: callable
+        @return: result of f
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = f(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+def _group_for(f):
+    name = '%s.%s' % (f.__module__, f.__name__)
+    group = groups.get(name)
+    if group is None:
+        with _groups_lock:
+            group = groups.setdefault(name, Group(name))
+    return group
+
+def coalesce():
+    """
+    Decorator that coalesces concurrent calls made with equal arguments
+
+    @return:
+    """
+    def coalesce(f, *args, **kwargs):
+        return _group_for(f).do((args, tuple(sorted(kwargs.items()))), f, *args, **kwargs)
+    return decorator(coalesce)
+
+def stats():
+    """
+    Call and coalesced counts per decorated function
+
+    @return:dict
+    """
+    return dict((name, {'calls': group.calls, 'coalesced': group.coalesced}) for name, group in groups.items())
@@ -0,0 +1,98 @@
+"""
+
+Template precompilation
+
+Mako compiles each template into a Python module the first time it is rendered. By default that happens in memory,
+separately in every worker, on the first request for each template. With mako.module_directory set, compiled modules
+are written to disk and reused by every process and every restart. compile_templates.py fills that directory at
+build time, so nothing compiles after a deploy. warm() loads every template into the lookup when the application is
+made, from the module directory where possible. A preforking master does that once and its workers share the result.
+
+The lookup is the one Pyramid's mako renderer uses: it is created here the way Pyramid would create it, then
+registered in its place.
+
+Filesystem checks compare each template's mtime with its compiled module every time it is rendered. They follow
+reload_templates (or reload_all) unless mako.filesystem_checks says otherwise; turn them off in production.
+
+Configuration
+
+mako.directories          Template directories, as asset specs (netl:/templates), one per line
+mako.module_directory     Where compiled template modules are kept (default none: compile in memory)
+mako.filesystem_checks    Check templates for changes when rendering (default reload_templates)
+mako.input_encoding       (default utf-8)
+
+Usage
+
+templates.init(config.registry)     # after creating the Configurator, before anything renders
+templates.warm()
+
+"""
+import logging
+import os
+import time
+from pyramid.asset import abspath_from_asset_spec
+from pyramid.mako_templating import IMakoLookup, PkgResourceTemplateLookup
+
+config = {}
+lookup = None
+
+logging.basicConfig()
+log = logging.getLogger(__file__)
+log.setLevel(logging.DEBUG)
+
+def find():
+    """
+    Every template under the template directories
+
+    @return: generator of template uris, as given to the renderer (index/index.mako)
+    """
+    for directory in config['directories']:
+        for root, dirs, files in os.walk(directory):
+            for name in sorted(files):
+                if name.endswith('.mako'):
+                    yield os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/')
+
+def compile_all():
+    """
+    Load every template. Any without an up to date compiled module are compiled, and written to
+    mako.module_directory if it is set.
+
+    @return:int Number of templates
+    """
+    count = 0
+    for uri in find():
+        lookup.get_template(uri)
+        count += 1
+    return count
+
+def warm():
+    """
+    Load every template so that no request waits for one to compile
+
+    @return:
+    """
+    start = time.time()
+    count = compile_all()
+    log.debug("Loaded %d templates in %.1f ms" % (count, (time.time() - start) * 1000))
+
+def init(registry):
+    """
+    Create the template lookup and register it for Pyramid's mako renderer
+
+    @param registry: Pyramid registry; its settings are read (see module docs)
+    @return: the lookup
+    """
+    global lookup
+
+    settings = registry.settings
+    config['directories'] = [abspath_from_asset_spec(d.strip()) for d in settings['mako.directories'].splitlines()
+                             if d.strip()]
+    config['module_directory'] = settings.get('mako.module_directory')
+    config['filesystem_checks'] = settings.get('mako.filesystem_checks', settings.get('reload_templates', False))
+
+    lookup = PkgResourceTemplateLookup(directories=config['directories'],
+                                       module_directory=config['module_directory'],
+                                       input_encoding=settings.get('mako.input_encoding', 'utf-8'),
+                                       filesystem_checks=config['filesystem_checks'])
+    registry.registerUtility(lookup, IMakoLookup)
+    return lookup
@@ -1,8 +1,34 @@
 from base64 import urlsafe_b64encode
 from hashlib import sha256
-import re
 import os
+import threading
 
+# Tokens' worth of entropy drawn from the OS at a time
+BLOCK_TOKENS = 128
+TOKEN_BYTES = 32
+
+# From rfc3548
+_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+
+_buffer = threading.local()
+
+def _seed():
+    """
+    Hand out TOKEN_BYTES of entropy from a per-thread buffer, refilled from os.urandom a block at a time. The buffer
+    is discarded after a fork, so parent and child never hand out the same bytes.
+
+    @return:str
+    """
+    buffer = _buffer
+    pid = os.getpid()
+    if getattr(buffer, 'pid', None) != pid or buffer.offset >= len(buffer.block):
+        buffer.block = os.urandom(TOKEN_BYTES * BLOCK_TOKENS)
+        buffer.offset = 0
+        buffer.pid = pid
+
+    seed = buffer.block[buffer.offset:buffer.offset + TOKEN_BYTES]
+    buffer.offset += TOKEN_BYTES
+    return seed
 
 def create_token():
     """
@@ -11,7 +37,7 @@ def create_token():
     @return:str
     """
     # Get random seed
-    seed = os.urandom(32)
+    seed = _seed()
 
     # Protect generator
     binary_token = sha256(sha256(seed).digest()).digest()
@@ -29,8 +55,8 @@ def valid_token(token):
     if len(token) != 42:
         return False
 
-    # From rfc3548
-    if not re.match(r'^[A-Za-z0-9\-_]+$', token):
+    # Stripping every valid char leaves nothing unless there's an invalid one
+    if token.strip(_ALPHABET):
         return False
 
-    return True
\ No newline at end of file
+    return True
@@ -12,9 +12,24 @@ although for the most part that shouldn't be necessary.
 
 In the event that the validation fails, a ValidationError will be raised
 
+A view can instead declare all the parameters it expects up front, as a schema. Schemas are compiled once, at
+import, and check the whole set of parameters in a single pass. Every declared parameter must be present exactly
+once (unless optional); undeclared parameters are ignored and don't appear in the result.
+
+@validate.schema(username=validate.username, password=validate.password, remember=validate.optional('yes|no'))
+def authenticate(request):
+    username = request.valid['username']
+
+A string in place of a validator is a regular expression the whole value must match.
+
 """
 
 import re
+from decorator import decorator
+
+_username = re.compile(r'[a-z0-9\-_]+\Z')
+_email = re.compile(r'[^@\s]+@[^@\.\s]+\.[^@\s]+\Z')
+_number = re.compile(r'[1-9][0-9]*\Z')
 
 class ValidationError(Exception):
     pass
@@ -44,7 +59,7 @@ def username(s):
     if len(s) > 63:
         raise ValidationError()
 
-    if not re.match(r'[a-z0-9\-_]+', s):
+    if not _username.match(s):
         raise ValidationError()
 
     return s
@@ -68,7 +83,7 @@ def email(s):
     if not ascii(s):
         raise ValidationError()
 
-    if not re.match(r'\S+?@[^@\.]+\.[^@]', s):
+    if not _email.match(s):
         raise ValidationError()
 
     return s
@@ -80,7 +95,7 @@ def number(s):
     if len(s) < 1:
         raise ValidationError()
 
-    if not re.match(r'[1-9][0-9]*', s):
+    if not _number.match(s):
         raise ValidationError()
 
     try:
@@ -90,4 +105,75 @@ def number(s):
 
     return s
 
-    
\ No newline at end of file
+def pattern(regex):
+    """
+    Validator requiring the whole value to match a regular expression. Compiled once, when called.
+    """
+    compiled = re.compile(r'(?:%s)\Z' % regex)
+
+    def match(s):
+        if not compiled.match(s):
+            raise ValidationError()
+        return s
+    return match
+
+class optional(object):
+    """
+    Marks a schema parameter as optional, with the value to use when it's absent
+    """
+    def __init__(self, check, default=None):
+        self.check = check
+        self.default = default
+
+class Schema(object):
+    """
+    Compiled set of expected parameters. Call with a MultiDict (request.POST, request.GET) to get a dict of
+    validated values.
+    """
+    def __init__(self, **fields):
+        self.checks = {}
+        self.defaults = {}
+        for name, check in fields.items():
+            if isinstance(check, optional):
+                self.defaults[name] = check.default
+                check = check.check
+
+            if isinstance(check, basestring):
+                check = pattern(check)
+
+            self.checks[name] = check
+
+    def __call__(self, params):
+        values = {}
+        checks = self.checks
+        for name, value in params.iteritems():
+            check = checks.get(name)
+            if check is None:
+                continue
+
+            # Repeated parameters are never expected
+            if name in values:
+                raise ValidationError()
+
+            values[name] = check(value)
+
+        if len(values) < len(checks):
+            missing = [name for name in checks if name not in values]
+            for name in missing:
+                if name not in self.defaults:
+                    raise ValidationError()
+                values[name] = self.defaults[name]
+
+        return values
+
+def schema(**fields):
+    """
+    Decorator validating the request's parameters (POST for a POST, otherwise GET) against a schema, and leaving
+    the validated values in request.valid
+    """
+    compiled = Schema(**fields)
+
+    def schema(f, request):
+        request.valid = compiled(request.POST if request.method == 'POST' else request.GET)
+        return f(request)
+    return decorator(schema)
@@ -1,2 +1,2 @@
-import news, user
-__all__ = ['news','user']
+import news, popularity, user
+__all__ = ['news','popularity','user']
@@ -1,8 +1,129 @@
 from datetime import datetime
 import netl.lib.db as db
+from netl.lib import singleflight
+
+CURSOR_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+HEADLINE_OPTIONS = 'MaxFragments=2, MaxWords=20, MinWords=5, StartSel=<b>, StopSel=</b>'
+# Content is HTML-escaped before highlighting, so the only markup in a snippet is the highlighting
+HEADLINE_CONTENT = "replace(replace(replace(content, '&', '&amp;'), '<', '&lt;'), '>', '&gt;')"
+
+class InvalidCursor(Exception):
+    pass
 
 def add(title, content):
     return db.query('insert into news (dated, title, content) values (:dated, :title, :content) returning id', dated=datetime.now(), title=title, content=content).scalar()
 
+def add_many(items, chunk_size=500):
+    """
+    Add a batch of news items within the current transaction. Inserts go out as multi-row statements of up to
+    chunk_size rows, so items may be a generator over an arbitrarily long feed.
+
+    :param items: iterable of (title, content) pairs
+    :param chunk_size: rows per insert statement
+    :return: list of ids, in the same order as items
+    """
+    ids = []
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            ids.extend(_add_chunk(chunk))
+            chunk = []
+
+    if chunk:
+        ids.extend(_add_chunk(chunk))
+
+    return ids
+
+def _add_chunk(items):
+    # Reserve the ids up front; the order of rows coming back from a multi-row insert ... returning is not
+    # something postgres promises, explicitly assigned ids are.
+    ids = [row[0] for row in db.query("select nextval('news_id_seq') from generate_series(1, :count)", count=len(items))]
+
+    values = []
+    params = {'dated': datetime.now()}
+    for n, (title, content) in enumerate(items):
+        values.append('(:id_%d, :dated, :title_%d, :content_%d)' % (n, n, n))
+        params['id_%d' % n] = ids[n]
+        params['title_%d' % n] = title
+        params['content_%d' % n] = content
+
+    db.query('insert into news (id, dated, title, content) values ' + ', '.join(values), **params)
+    return ids
+
+@singleflight.coalesce()
 def get(id):
-    return db.query('select * from news where id=:id',id=id)
\ No newline at end of file
+    return db.query('select id, dated, title, content from news where id=:id',id=id).first()
+
+def cursor_for(item):
+    """
+    Opaque paging cursor that resumes a listing immediately after the given item
+
+    :param item: row as returned by page()
+    :return: cursor string
+    """
+    return '%s_%d' % (item['dated'].strftime(CURSOR_FORMAT), item['id'])
+
+def _parse_cursor(cursor):
+    try:
+        dated, id = cursor.rsplit('_', 1)
+        return datetime.strptime(dated, CURSOR_FORMAT), int(id)
+    except ValueError:
+        raise InvalidCursor()
+
+def page(cursor=None, limit=50):
+    """
+    Retrieve a page of news for listing, newest first. Pages by keyset on (dated, id) so deep pages cost the same
+    as the first one, and rows are streamed from the database rather than loaded as a whole.
+
+    :param cursor: value of cursor_for() on the last item of the previous page, or None for the first page
+    :param limit: maximum items in the page
+    :return: generator of rows
+    """
+    if not cursor:
+        return db.stream('select id, dated, title, content from news order by dated desc, id desc limit :limit',
+                         limit=limit)
+
+    dated, id = _parse_cursor(cursor)
+    return db.stream('select id, dated, title, content from news where (dated, id) < (:dated, :id) '
+                     'order by dated desc, id desc limit :limit', dated=dated, id=id, limit=limit)
+
+
+def search_cursor_for(item):
+    """
+    Opaque paging cursor that resumes a search immediately after the given item
+
+    :param item: row as returned by search()
+    :return: cursor string
+    """
+    return '%r_%d' % (item['rank'], item['id'])
+
+def search(terms, cursor=None, limit=20):
+    """
+    Full-text search over news titles and content, best match first. Title matches outrank content matches.
+    Pages by keyset on (rank, id), and highlight snippets are only generated for the rows in the page.
+
+    :param terms: free text search terms
+    :param cursor: value of search_cursor_for() on the last item of the previous page, or None for the first page
+    :param limit: maximum items in the page
+    :return: list of rows with id, dated, title, rank and snippet (HTML: escaped content, matches in <b>)
+    """
+    params = {'terms': terms, 'limit': limit, 'options': HEADLINE_OPTIONS}
+    after = ''
+    if cursor:
+        try:
+            rank, id = cursor.rsplit('_', 1)
+            params['rank'] = float(rank)
+            params['id'] = int(id)
+        except ValueError:
+            raise InvalidCursor()
+        # Ranks are float4; compare in that type so the row the cursor came from doesn't reappear
+        after = 'and (ts_rank(search, query), id) < (cast(:rank as real), :id)'
+
+    return db.query("select id, dated, title, rank, ts_headline('english', " + HEADLINE_CONTENT + ", query, :options) "
+                    "as snippet "
+                    "from (select id, dated, title, content, query, ts_rank(search, query) as rank "
+                    "      from news, plainto_tsquery('english', :terms) query "
+                    "      where search @@ query " + after +
+                    "      order by rank desc, id desc limit :limit) page "
+                    "order by rank desc, id desc", **params).fetchall()
@@ -0,0 +1,183 @@
+"""
+
+Popularity tracking
+
+Page views are counted in memory and written out periodically as a single batched upsert, rather than as a write
+per request. Counts are held per item per time bucket; the number of distinct items pending is bounded, and
+reaching the bound forces an early flush. Pending counts are flushed on shutdown.
+
+Counts are lost if the process dies without shutting down cleanly. Like the event log, that's not a big deal.
+
+Configuration
+
+popularity.flush_interval   Seconds between flushes (default 10)
+popularity.max_pending      Distinct items held in memory before an early flush (default 10000)
+popularity.bucket           Seconds covered by each stored counter (default 3600)
+
+Usage
+
+popularity.record(item_id)
+
+popularity.trending(hours=6)
+
+"""
+from datetime import datetime, timedelta
+import atexit
+import logging
+import threading
+import time
+import netl.lib.db as db
+
+config = {}
+
+_pending = {}
+_lock = threading.Lock()
+_stop = threading.Event()
+_flusher = None
+
+logging.basicConfig()
+log = logging.getLogger(__file__)
+log.setLevel(logging.DEBUG)
+
+def _bucket(when):
+    seconds = int(time.mktime(when.timetuple()))
+    return datetime.fromtimestamp(seconds - seconds % config['bucket'])
+
+def record(news_id):
+    """
+    Count a view of a news item. Call it once the item is known to exist.
+
+    :param news_id:
+    :return:
+    """
+    if _flusher is None:
+        _start()
+
+    key = (news_id, _bucket(datetime.now()))
+    with _lock:
+        _pending[key] = _pending.get(key, 0) + 1
+        full = len(_pending) >= config['max_pending']
+
+    if full:
+        flush()
+
+def flush():
+    """
+    Write all pending counts to the database in one statement
+
+    :return:
+    """
+    global _pending
+
+    with _lock:
+        pending = _pending
+        _pending = {}
+
+    if not pending:
+        return
+
+    values = []
+    params = {}
+    for n, ((news_id, bucket), views) in enumerate(pending.iteritems()):
+        values.append('(:id_%d, :bucket_%d, :views_%d)' % (n, n, n))
+        params['id_%d' % n] = news_id
+        params['bucket_%d' % n] = bucket
+        params['views_%d' % n] = views
+
+    try:
+        # Counts for items that don't exist (or no longer do) are left out, rather than failing the whole batch on
+        # the foreign key
+        db.execute('insert into news_views (news_id, bucket, views) '
+                   'select v.news_id, v.bucket, v.views '
+                   'from (values ' + ', '.join(values) + ') v (news_id, bucket, views) '
+                   'where exists (select 1 from news n where n.id = v.news_id) '
+                   'on conflict (news_id, bucket) do update set views = news_views.views + excluded.views', **params)
+    except Exception:
+        log.exception("Dropped %d pending view counts" % len(pending))
+        return
+
+    log.debug("Flushed %d view counts" % len(pending))
+
+def trending(hours=6, baseline_hours=7*24, limit=20):
+    """
+    Items drawing the most views recently relative to their own usual rate
+
+    :param hours: length of the recent period
+    :param baseline_hours: length of the period the usual rate is taken from; must exceed hours. The usual rate is
+                           the views before the recent period, scaled to its length, so a burst doesn't raise its own
+                           baseline and quiet hours (which have no rows) still count.
+    :param limit: maximum items
+    :return: list of rows with id, dated, title, recent, baseline (views expected in the recent period) and position
+    """
+    now = datetime.now()
+    return db.query('select n.id, n.dated, n.title, t.recent, t.baseline, t.position '
+                    'from (select news_id, recent, baseline, '
+                    '             rank() over (order by (recent + 1) / (baseline + 1) desc, recent desc) as position '
+                    '      from (select distinct news_id, '
+                    '                   sum(case when bucket >= :recent_since then views else 0 end) over w as recent, '
+                    '                   sum(case when bucket < :recent_since then views else 0 end) over w '
+                    '                       * :hours / (:baseline_hours - :hours) as baseline '
+                    '            from news_views where bucket >= :baseline_since '
+                    '            window w as (partition by news_id)) per_item) t '
+                    'join news n on n.id = t.news_id '
+                    'where t.position <= :limit '
+                    'order by t.position',
+                    recent_since=now - timedelta(hours=hours),
+                    baseline_since=now - timedelta(hours=baseline_hours),
+                    hours=float(hours),
+                    baseline_hours=float(baseline_hours),
+                    limit=limit).fetchall()
+
+def _run():
+    while not _stop.wait(config['flush_interval']):
+        flush()
+
+def shutdown():
+    """
+    Stop the background flusher and write out anything pending
+
+    :return:
+    """
+    _stop.set()
+    if _flusher:
+        _flusher.join()
+    flush()
+
+def init(settings):
+    """
+    Initialise popularity tracking. The background flusher starts with the first recorded view.
+
+    :param settings: dict Popularity configuration settings (see module docs)
+    :return:
+    """
+    config['flush_interval'] = settings.get('popularity.flush_interval', 10)
+    config['max_pending'] = settings.get('popularity.max_pending', 10000)
+    config['bucket'] = settings.get('popularity.bucket', 60*60)
+
+    # init may run again (a reload re-creates the application); shutdown only needs registering once
+    if not config.get('registered'):
+        atexit.register(shutdown)
+        config['registered'] = True
+
+def _start():
+    global _flusher
+
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run, name='popularity-flush')
+            _flusher.daemon = True
+            _flusher.start()
+
+def after_fork():
+    """
+    Start afresh in a forked worker: the flusher thread did not survive the fork, and counts pending in the parent
+    are the parent's to write
+
+    :return:
+    """
+    global _pending, _lock, _stop, _flusher
+
+    _pending = {}
+    _lock = threading.Lock()
+    _stop = threading.Event()
+    _flusher = None
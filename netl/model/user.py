@@ -1,4 +1,5 @@
 import netl.lib.db as db
+from netl.lib import singleflight
 
 class RequestAuth(object):
     real = None
@@ -8,6 +9,7 @@ class RequestAuth(object):
         self.real = real
         self.user = actor
 
+@singleflight.coalesce()
 def get_request_object(real_id, actor_id):
     """
     Retrieve real and actor rows from database
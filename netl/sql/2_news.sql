@@ -0,0 +1,9 @@
+CREATE TABLE news (
+  id SERIAL PRIMARY KEY,
+  dated TIMESTAMP NOT NULL,
+  title TEXT,
+  content TEXT
+);
+
+-- Keyset paging walks this index newest-first
+CREATE INDEX news_dated_id ON news (dated DESC, id DESC);
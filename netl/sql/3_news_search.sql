@@ -0,0 +1,16 @@
+ALTER TABLE news ADD COLUMN search tsvector;
+
+CREATE FUNCTION news_search_update() RETURNS trigger AS $$
+BEGIN
+  NEW.search := setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER news_search_update BEFORE INSERT OR UPDATE OF title, content ON news
+  FOR EACH ROW EXECUTE PROCEDURE news_search_update();
+
+UPDATE news SET title = title;
+
+CREATE INDEX news_search ON news USING gin (search);
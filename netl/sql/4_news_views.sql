@@ -0,0 +1,9 @@
+-- View counts per item per time bucket, written in batches by netl.model.popularity
+CREATE TABLE news_views (
+  news_id INTEGER NOT NULL REFERENCES news (id),
+  bucket TIMESTAMP NOT NULL,
+  views INTEGER NOT NULL,
+  PRIMARY KEY (news_id, bucket)
+);
+
+CREATE INDEX news_views_bucket ON news_views (bucket);
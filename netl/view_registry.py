@@ -0,0 +1,34 @@
+"""
+Views found by scanning netl.views, as arguments to add_view. Generated by build_view_registry.py; do not edit.
+"""
+views = [
+    ('netl.views.assets', {'route_name': 'assets', 'view': 'netl.views.assets.assets:serve'}),
+    ('netl.views.auth_service', {'context': 'netl.lib.ratelimit:RateLimitedException', 'renderer': 'json', 'view': 'netl.views.auth_service.local:on_rate_limited'}),
+    ('netl.views.auth_test', {'context': 'netl.lib.auth:NoUserException', 'renderer': 'json', 'view': 'netl.views.auth_test.auth_test:on_no_user'}),
+    ('netl.views.auth_test', {'context': 'netl.lib.auth:InsufficientPermissionsException', 'renderer': 'json', 'view': 'netl.views.auth_test.auth_test:on_not_admin'}),
+    ('netl.views.auth_test', {'renderer': 'json', 'route_name': 'auth_login', 'view': 'netl.views.auth_test.auth_test:user_login'}),
+    ('netl.views.auth_test', {'renderer': 'json', 'route_name': 'auth_test', 'view': 'netl.views.auth_test.auth_test:user_test'}),
+    ('netl.views.identity_test', {'renderer': 'json', 'route_name': 'identity_get', 'view': 'netl.views.identity_test.identity_test:identity_get'}),
+    ('netl.views.identity_test', {'renderer': 'json', 'route_name': 'identity_login', 'view': 'netl.views.identity_test.identity_test:identity_login'}),
+    ('netl.views.identity_test', {'renderer': 'json', 'route_name': 'identity_logout', 'view': 'netl.views.identity_test.identity_test:identity_logout'}),
+    ('netl.views.index', {'renderer': 'string', 'route_name': 'favicon', 'view': 'netl.views.index.index:favicon'}),
+    ('netl.views.index', {'renderer': 'index/index.mako', 'route_name': 'index', 'view': 'netl.views.index.index:index'}),
+    ('netl.views.index', {'context': 'netl.lib.validate:ValidationError', 'renderer': 'json', 'view': 'netl.views.index.index:on_invalid'}),
+    ('netl.views.item', {'renderer': 'json', 'route_name': 'item.add', 'view': 'netl.views.item.item:add'}),
+    ('netl.views.item', {'renderer': 'json', 'request_method': 'POST', 'route_name': 'item.add_many', 'view': 'netl.views.item.item:add_many'}),
+    ('netl.views.item', {'renderer': 'json', 'route_name': 'item.get', 'view': 'netl.views.item.item:get'}),
+    ('netl.views.item', {'route_name': 'item.list', 'view': 'netl.views.item.item:list_items'}),
+    ('netl.views.item', {'renderer': 'json', 'route_name': 'item.search', 'view': 'netl.views.item.item:search'}),
+    ('netl.views.item', {'renderer': 'json', 'route_name': 'item.trending', 'view': 'netl.views.item.item:trending'}),
+    ('netl.views.log', {'renderer': 'json', 'request_method': 'POST', 'route_name': 'log.js', 'view': 'netl.views.log.log:report'}),
+    ('netl.views.session_admin', {'renderer': 'json', 'route_name': 'session_admin.counts', 'view': 'netl.views.session_admin.session_admin:counts'}),
+    ('netl.views.session_admin', {'renderer': 'json', 'request_method': 'POST', 'route_name': 'session_admin.expire', 'view': 'netl.views.session_admin.session_admin:expire_sessions'}),
+    ('netl.views.session_admin', {'renderer': 'json', 'route_name': 'session_admin.list', 'view': 'netl.views.session_admin.session_admin:list_sessions'}),
+    ('netl.views.session_test', {'renderer': 'json', 'route_name': 'csrf_check', 'view': 'netl.views.session_test.session_test:csrf_check'}),
+    ('netl.views.session_test', {'renderer': 'json', 'route_name': 'csrf_get', 'view': 'netl.views.session_test.session_test:csrf_get'}),
+    ('netl.views.session_test', {'renderer': 'json', 'route_name': 'session_expire', 'view': 'netl.views.session_test.session_test:session_expire'}),
+    ('netl.views.session_test', {'renderer': 'json', 'route_name': 'session_rotate', 'view': 'netl.views.session_test.session_test:session_rotate'}),
+    ('netl.views.session_test', {'renderer': 'json', 'route_name': 'session_test', 'view': 'netl.views.session_test.session_test:session_test'}),
+    ('netl.views.stats', {'renderer': 'json', 'route_name': 'stats.compression', 'view': 'netl.views.stats.stats:compression'}),
+    ('netl.views.stats', {'renderer': 'json', 'route_name': 'stats.events', 'view': 'netl.views.stats.stats:events'}),
+]
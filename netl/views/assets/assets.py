@@ -0,0 +1,42 @@
+"""
+Serves built assets (see netl.lib.assets), choosing a precompressed copy by Accept-Encoding
+"""
+import mimetypes
+import os
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.response import Response
+from pyramid.view import view_config
+from netl.lib import assets
+
+# Preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+@view_config(route_name='assets')
+def serve(request):
+    path = '/'.join(request.matchdict['path'])
+    if not assets.built(path):
+        # Only built files are served, which also rules out escaping the build directory
+        raise HTTPNotFound()
+
+    filename = os.path.join(assets.config['directory'], path)
+    content_type, encoding = mimetypes.guess_type(filename)
+
+    response = Response(content_type=content_type or 'application/octet-stream')
+    response.vary = ('Accept-Encoding',)
+    response.cache_control = 'public, max-age=%d' % assets.config['max_age']
+    response.conditional_response = True
+
+    # The name carries the content's hash, so it serves as the ETag for revalidation too; each encoding is a
+    # different representation, so gets its own
+    response.etag = path
+    for encoding, suffix in ENCODINGS:
+        if encoding in request.accept_encoding and os.path.exists(filename + suffix):
+            filename += suffix
+            response.content_encoding = encoding
+            response.etag = '%s-%s' % (path, encoding)
+            break
+
+    # Setting app_iter resets the length, so set the length after
+    response.app_iter = open(filename, 'rb')
+    response.content_length = os.path.getsize(filename)
+    return response
@@ -4,19 +4,60 @@ Authentication via Facebook OAuth 2.0
 sign_in should be opened in a new (facebook-sized) window. At the completion of the sign in and authentication,
 the callback page will trigger an event on the parent then close.
 
+Outbound calls go through netl.lib.outbound, so they share pooled connections to the provider and time out rather
+than hold a worker indefinitely.
+
+Configuration
+
+facebook.app_id         Application id
+facebook.secret         Application secret
+facebook.dialog_url     Authorize dialog (default https://www.facebook.com/dialog/oauth)
+facebook.graph_url      Graph API root (default https://graph.facebook.com); point at a fake provider to test offline
 
 """
+import urllib
+from pyramid.httpexceptions import HTTPFound
+from netl.lib import outbound
+
+def _settings(request):
+    settings = request.registry.settings
+    return (settings['facebook.app_id'], settings['facebook.secret'],
+            settings.get('facebook.dialog_url', 'https://www.facebook.com/dialog/oauth'),
+            settings.get('facebook.graph_url', 'https://graph.facebook.com'))
 
 def sign_in(request):
     """
     Simply redirects to fb authorize url
 
     """
-    pass
+    app_id, secret, dialog_url, graph_url = _settings(request)
+    return HTTPFound(location=dialog_url + '?' + urllib.urlencode({
+        'client_id': app_id,
+        'redirect_uri': request.route_url('facebook.authenticate'),
+        'state': request.session.create_csrf_token('facebook.sign_in'),
+    }))
 
 def authenticate(request):
     """
     Accept provided code, generate access url, request access token from access url
     use access token to obtain user data if needed
     """
-    pass
\ No newline at end of file
+    request.session.consume_csrf_token(request.params.get('state'), 'facebook.sign_in')
+
+    app_id, secret, dialog_url, graph_url = _settings(request)
+    token = outbound.get(graph_url + '/oauth/access_token', {
+        'client_id': app_id,
+        'client_secret': secret,
+        'redirect_uri': request.route_url('facebook.authenticate'),
+        'code': request.params['code'],
+    }).form().get('access_token')
+
+    if not token:
+        # Return an error, user declined or code expired
+        return
+
+    profile = outbound.get(graph_url + '/me', {'access_token': token}, cache=True).json()
+
+    # Find or create user for profile['id']
+    # Set up identity session
+    # Render callback page
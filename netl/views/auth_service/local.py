@@ -5,17 +5,24 @@ Works differently from the others since it assumes the JS app knows the username
 request authenticate directly.
 
 """
-from netl.lib import validate
+from pyramid.view import view_config
+from netl.lib import ratelimit, validate
 
 import netl.model as m
 
+# Every attempt costs a password hash, so these are limited before any work is done. Each view has its own limits.
+limit_attempts = ratelimit.limit(ratelimit.by_ip(20, 60),
+                                 ratelimit.by_param('username', 5, 60))
+
+@limit_attempts
+@validate.schema(username=validate.username, password=validate.password)
 def authenticate(request):
     """
     Accept email address, password in POST, set up session if valid otherwise hand back error in json
     """
 
-    username = validate.username(request.POST['username'])
-    password = validate.password(request.POST['password'])
+    username = request.valid['username']
+    password = request.valid['password']
 
     if not m.user.local_authenticate(username, password):
         # Return an error, u/p invalid or whatever
@@ -32,13 +39,15 @@ def authenticate(request):
     # Set up identity session
     # Return user info to json
 
+@limit_attempts
+@validate.schema(username=validate.username, password=validate.password, email=validate.email)
 def sign_up(request):
     """
     Create user given email address, password
     """
-    username = validate.username(request.POST['username'])
-    password = validate.password(request.POST['password'])
-    email = validate.email(request.POST['email'])
+    username = request.valid['username']
+    password = request.valid['password']
+    email = request.valid['email']
 
     # Create user
     user = m.user.local_sign_up(username, password, email)
@@ -51,4 +60,7 @@ def sign_up(request):
     # set up identity session
     # return user info to json
 
-
+@view_config(context=ratelimit.RateLimitedException, renderer='json')
+def on_rate_limited(request):
+    request.response.status = 429
+    return {'status': 'too many attempts, try again later'}
@@ -1,4 +1,5 @@
 from pyramid.view import view_config
+from netl.lib import validate
 
 @view_config(route_name='index', renderer='index/index.mako')
 def index(request):
@@ -6,4 +7,9 @@ def index(request):
 
 @view_config(route_name='favicon', renderer='string')
 def favicon(request):
-    return ''
\ No newline at end of file
+    return ''
+
+@view_config(context=validate.ValidationError, renderer='json')
+def on_invalid(request):
+    request.response.status = 400
+    return {'status': 'invalid request'}
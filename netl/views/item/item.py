@@ -1,6 +1,13 @@
+from json import loads
+from pyramid.httpexceptions import HTTPNotFound
 from pyramid.view import view_config
+from netl.lib import renderer, validate
 from netl.model import *
 
+INGEST_CHUNK_SIZE = 500
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
 @view_config(route_name='item.add', renderer='json')
 def add(request):
     if not (request.params.has_key('title') and request.params.has_key('content')):
@@ -13,10 +20,88 @@ def add(request):
 
     return {'id': str(id)}
 
+def _loads(text):
+    try:
+        return loads(text)
+    except ValueError:
+        raise validate.ValidationError()
+
+def _ndjson(lines):
+    for line in lines:
+        if line.strip():
+            yield _loads(line)
+
+def _ingest_items(request):
+    """
+    Yield (title, content) pairs from either a JSON array body or, for application/x-ndjson, one JSON object per
+    line read incrementally from the body so large imports never sit in memory whole.
+    """
+    if request.content_type == 'application/x-ndjson':
+        objects = _ndjson(request.body_file)
+    else:
+        objects = _loads(request.body)
+        if not isinstance(objects, list):
+            raise validate.ValidationError()
+
+    for item in objects:
+        if not isinstance(item, dict) or not (item.has_key('title') and item.has_key('content')):
+            raise validate.ValidationError()
+        yield item['title'], item['content']
+
+@view_config(route_name='item.add_many', renderer='json', request_method='POST')
+def add_many(request):
+    chunk_size = int(request.registry.settings.get('news.ingest_chunk_size', INGEST_CHUNK_SIZE))
+
+    ids = model.news.add_many(_ingest_items(request), chunk_size)
+
+    return {'ids': [str(id) for id in ids]}
+
+def _list_item(item):
+    return {'date': item['dated'], 'title': item['title'], 'content': item['content'], 'id': str(item['id'])}
+
+@view_config(route_name='item.list')
+def list_items(request):
+    limit = int(validate.number(request.params.get('limit', str(PAGE_SIZE))))
+    if limit > MAX_PAGE_SIZE:
+        raise validate.ValidationError()
+
+    try:
+        items = model.news.page(request.params.get('cursor'), limit)
+    except model.news.InvalidCursor:
+        raise validate.ValidationError()
+
+    # Encoded as rows arrive; the cursor for the following page is only known once the last item has been seen, so it
+    # trails the array
+    return renderer.stream(items, convert=_list_item,
+                           trailer=lambda last: {'next': model.news.cursor_for(last) if last is not None else None})
+
+@view_config(route_name='item.search', renderer='json')
+def search(request):
+    limit = int(validate.number(request.params.get('limit', str(PAGE_SIZE))))
+    if limit > MAX_PAGE_SIZE:
+        raise validate.ValidationError()
+
+    try:
+        items = model.news.search(request.params['q'], request.params.get('cursor'), limit)
+    except model.news.InvalidCursor:
+        raise validate.ValidationError()
+
+    return {'items': [{'date': item['dated'], 'title': item['title'], 'snippet': item['snippet'], 'id': str(item['id'])} for item in items],
+            'next': model.news.search_cursor_for(items[-1]) if len(items) == limit else None}
+
+@view_config(route_name='item.trending', renderer='json')
+def trending(request):
+    items = model.popularity.trending()
+
+    return {'items': [{'date': item['dated'], 'title': item['title'], 'id': str(item['id'])} for item in items]}
+
 @view_config(route_name='item.get', renderer='json')
 def get(request):
     id = request.matchdict['item']
 
-    item =  model.news.get(id)
+    item =  model.news.get(int(validate.number(id)))
+    if not item:
+        raise HTTPNotFound()
+    model.popularity.record(item['id'])
 
-    return {'date': str(item['date']), 'title': item['title'], 'content': item['content'], 'id': str(item['_id'])}
+    return {'date': item['dated'], 'title': item['title'], 'content': item['content'], 'id': str(item['id'])}
@@ -0,0 +1,39 @@
+from json import loads
+from pyramid.httpexceptions import HTTPLengthRequired, HTTPRequestEntityTooLarge
+from pyramid.view import view_config
+from netl.lib import js_errors, ratelimit, validate
+
+# A page reports its errors in batches, every few seconds at most
+limit_reports = ratelimit.limit(ratelimit.by_session(10, 60), ratelimit.by_ip(60, 60))
+
+def _errors(request):
+    """
+    The errors in a report: a JSON array of objects with a message, and optionally a stack and url. Reports over
+    js_errors.max_body bytes or with more than js_errors.max_batch errors are refused unread.
+    """
+    if request.content_length is None:
+        raise HTTPLengthRequired()
+    if request.content_length > js_errors.config['max_body']:
+        raise HTTPRequestEntityTooLarge()
+
+    try:
+        errors = loads(request.body)
+    except ValueError:
+        raise validate.ValidationError()
+    if not isinstance(errors, list) or len(errors) > js_errors.config['max_batch']:
+        raise validate.ValidationError()
+
+    for error in errors:
+        if not isinstance(error, dict) or not isinstance(error.get('message'), basestring):
+            raise validate.ValidationError()
+        for key in ('stack', 'url'):
+            if not isinstance(error.get(key) or u'', basestring):
+                raise validate.ValidationError()
+    return errors
+
+@view_config(route_name='log.js', renderer='json', request_method='POST')
+@limit_reports
+def report(request):
+    errors = _errors(request)
+    js_errors.record(request.session.id, request.user_agent, errors)
+    return {'accepted': len(errors)}
@@ -0,0 +1,27 @@
+from pyramid.view import view_config
+from netl.lib import auth, session, validate
+
+@view_config(route_name='session_admin.counts', renderer='json')
+@auth.require('view_sessions')
+def counts(request):
+    return {'counts': dict((str(user_id), count) for user_id, count in session.active_counts().items())}
+
+@view_config(route_name='session_admin.list', renderer='json')
+@auth.require('view_sessions')
+def list_sessions(request):
+    user_id = int(validate.number(request.matchdict['user']))
+
+    return {'sessions': session.list_for_user(user_id)}
+
+@view_config(route_name='session_admin.expire', renderer='json', request_method='POST')
+@auth.require('kill_sessions')
+def expire_sessions(request):
+    user_id = int(validate.number(request.matchdict['user']))
+
+    ids = request.POST.getall('id')
+    if ids:
+        session.expire_by_id(user_id, ids)
+    else:
+        session.expire_for_user(user_id)
+
+    return {'status': 'done'}
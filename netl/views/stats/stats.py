@@ -0,0 +1,37 @@
+import time
+from bson.objectid import ObjectId
+from pyramid.view import view_config
+from netl.lib import auth, compress, event_log, validate
+
+# Events returned per poll
+EVENTS_LIMIT = 500
+# Longest a poll waits for an event, in seconds
+EVENTS_WAIT = 30
+
+@view_config(route_name='stats.compression', renderer='json')
+@auth.require_admin()
+def compression(request):
+    # Counters are per process; under the prefork server this is the worker that took the request
+    return {'routes': compress.stats()}
+
+@view_config(route_name='stats.events', renderer='json')
+@auth.require_admin()
+@validate.schema(since=validate.optional('[0-9a-f]{24}'), wait=validate.optional(validate.number, '20'))
+def events(request):
+    # Long poll: returns as soon as there are events, or after wait seconds with none. Pass the since returned to
+    # the next poll to carry on from there; without one, the poll starts from now. Each waiting poll holds a worker,
+    # so keep admin feeds few.
+    since = ObjectId(request.valid['since']) if request.valid['since'] else event_log.position()
+    deadline = time.time() + min(int(request.valid['wait']), EVENTS_WAIT)
+
+    found = []
+    for event in event_log.follow(since):
+        if event is not None:
+            found.append(event)
+            since = event['_id']
+            if len(found) < EVENTS_LIMIT:
+                continue
+        if found or time.time() >= deadline:
+            break
+
+    return {'events': found, 'since': since}
@@ -0,0 +1,182 @@
+"""
+Adding a session shard while processes on the old and new node lists keep working: after each step every session is
+found where the process looking for it expects it, changes made meanwhile survive, and consumed CSRF tokens stay
+consumed. Runs rebalance_copy(), rebalance_prune() and the fan-out queries over in-memory stand-ins for the shards;
+no databases needed.
+"""
+from datetime import datetime, timedelta
+import copy
+from netl.lib import session
+from netl.lib.shard import HashRing
+from netl.lib.token import create_token
+
+USERS = 50
+SESSIONS = 2000
+
+def _matches(doc, spec):
+    for field, condition in spec.items():
+        if field == '$or':
+            if not any(_matches(doc, alternative) for alternative in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = doc.get(field)
+            for op, operand in condition.items():
+                if op == '$ne' and value == operand:
+                    return False
+                if op == '$gt' and not (value is not None and value > operand):
+                    return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+class Found(list):
+    def count(self):
+        return len(self)
+
+class Collection(object):
+    """
+    The part of a pymongo collection the session store uses
+    """
+    def __init__(self):
+        self.docs = []
+
+    def find(self, spec=None, fields=None):
+        return Found(copy.deepcopy(doc) for doc in self.docs if _matches(doc, spec or {}))
+
+    def find_one(self, spec):
+        found = self.find(spec)
+        return found[0] if found else None
+
+    def insert(self, doc):
+        doc.setdefault('_id', create_token())
+        self.docs.append(copy.deepcopy(doc))
+
+    def update(self, spec, change, upsert=False, multi=False):
+        matched = [doc for doc in self.docs if _matches(doc, spec)]
+        for doc in matched[:None if multi else 1]:
+            if '$unset' in change:
+                for field in change['$unset']:
+                    doc.pop(field, None)
+            elif '$inc' in change:
+                for field, by in change['$inc'].items():
+                    doc[field] = doc.get(field, 0) + by
+            else:
+                doc.clear()
+                doc.update(copy.deepcopy(change))
+        if not matched and upsert:
+            self.insert(change)
+
+    def remove(self, spec):
+        self.docs = [doc for doc in self.docs if not _matches(doc, spec)]
+
+    def ensure_index(self, *args, **kwargs):
+        pass
+
+class Store(object):
+    """
+    A shard's database: collections created on first use
+    """
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, Collection())
+
+    def __getattr__(self, name):
+        return self[name]
+
+def owned_by(ring, name):
+    # A fresh token the ring places on the named shard
+    token = create_token()
+    while ring.name_for(token) != name:
+        token = create_token()
+    return token
+
+def new_session(ring, user_id, last_update, session_id=None):
+    doc = {'session_id': session_id or create_token(), 'real_id': user_id, 'actor_id': user_id, 'last_update': last_update}
+    ring.node_for(doc['session_id']).session.insert(doc)
+    return doc['session_id']
+
+def new_token(ring, dated, csrf_id=None):
+    doc = {'csrf_id': csrf_id or create_token(), 'token': create_token(), 'key': 'form', 'dated': dated}
+    ring.node_for(doc['csrf_id']).csrf.insert(doc)
+    return doc['csrf_id']
+
+def consume(ring, csrf_id):
+    ring.node_for(csrf_id).csrf.remove({'csrf_id': csrf_id})
+
+def find(ring, collection, field, value, key):
+    return ring.node_for(key).__getattr__(collection).find_one({field: value})
+
+def located(ring):
+    # Every document sits only on the shard the ring gives it
+    for name, store in ring.nodes.items():
+        for collection, field, key, version in session._placement:
+            for doc in store[collection].find():
+                assert ring.name_for(key(doc)) == name, (collection, doc)
+
+session.config.update(timeout=3600, csrf_lifetime=600)
+now = datetime.now()
+
+old = HashRing([('shard%d' % n, Store()) for n in xrange(0, 3)])
+sessions = [new_session(old, n % USERS, now - timedelta(seconds=n % 600)) for n in xrange(0, SESSIONS)]
+tokens = [new_token(old, now - timedelta(seconds=60)) for n in xrange(0, SESSIONS)]
+for user_id in xrange(0, USERS):
+    old.node_for('epoch:%s' % user_id).epoch.insert({'_id': user_id, 'epoch': 1})
+
+session.ring = old
+before = dict((user_id, session.count_for_user(user_id)) for user_id in xrange(0, USERS))
+assert sum(before.values()) == SESSIONS
+
+# Step 1: copy onto the new shard; everyone still uses the old list
+added = Store()
+copied = session.rebalance_copy('shard3', added, old)
+new = HashRing(list(old.nodes.items()) + [('shard3', added)])
+moving = [s for s in sessions if new.name_for(s) == 'shard3']
+assert copied >= len(moving) > 0
+for s in sessions:
+    assert find(old, 'session', 'session_id', s, s)
+    assert find(new, 'session', 'session_id', s, s)
+
+# Step 2, mid-reload: processes on the old list and on the new one both at work
+touched = moving[0]
+doc = find(old, 'session', 'session_id', touched, touched)
+doc['last_update'] = now + timedelta(seconds=1)
+doc['data'] = 'changed by an old process'
+old.node_for(touched).session.update({'session_id': touched}, doc)
+
+late_session = new_session(old, 0, now, owned_by(new, 'shard3'))
+sessions.append(late_session)
+
+moving_tokens = [t for t in tokens if new.name_for(t) == 'shard3']
+consumed_old, consumed_new = moving_tokens[0], moving_tokens[1]
+consume(old, consumed_old)
+consume(new, consumed_new)
+late_token = new_token(old, datetime.now(), owned_by(new, 'shard3'))
+
+revoked = [u for u in xrange(0, USERS) if new.name_for('epoch:%s' % u) == 'shard3'][0]
+old.node_for('epoch:%s' % revoked).epoch.update({'_id': revoked}, {'$inc': {'epoch': 1}})
+
+# Step 3: everyone is on the new list; prune the old shards
+pruned = session.rebalance_prune(new)
+assert pruned > 0
+located(new)
+for s in sessions:
+    assert find(new, 'session', 'session_id', s, s), s
+assert find(new, 'session', 'session_id', touched, touched)['data'] == 'changed by an old process'
+assert not find(new, 'csrf', 'csrf_id', consumed_old, consumed_old)
+assert not find(new, 'csrf', 'csrf_id', consumed_new, consumed_new)
+assert find(new, 'csrf', 'csrf_id', late_token, late_token)
+assert find(new, 'epoch', '_id', revoked, 'epoch:%s' % revoked)['epoch'] == 2
+assert not any(store.rebalance.find() for store in new.nodes.values())
+assert not any(store[c].find({'copied_from': {'$ne': None}}) for store in new.nodes.values()
+               for c in ('session', 'csrf', 'epoch'))
+
+session.ring = new
+after = dict((user_id, session.count_for_user(user_id)) for user_id in xrange(0, USERS))
+before[0] += 1
+assert after == before, (before, after)
+assert sum(len(store.session.find()) for store in new.nodes.values()) == len(sessions)
+
+print("%d sessions: %d documents copied onto the new shard, %d pruned from the old ones, none lost" % (
+    len(sessions), copied, pruned))
@@ -0,0 +1,17 @@
+"""
+Background job: periodically recompute active session counts per user for dashboards.
+"""
+import time
+import netl.lib.session as session
+
+INTERVAL = 60
+
+session.init({'session.timeout': 10*60,
+              'session.mongodb_url': 'mongodb://localhost/',
+              'session.mongodb_db': 'session'})
+
+while True:
+    start = time.time()
+    users = session.compute_active_counts()
+    print("%d users with active sessions, counted in %.2f s" % (users, time.time() - start))
+    time.sleep(INTERVAL)
@@ -0,0 +1,27 @@
+"""
+Fraction of session tokens that change shard when a node is added to the consistent hash ring, and how evenly
+tokens spread across nodes. In memory only; no databases needed.
+"""
+from netl.lib.shard import HashRing
+from netl.lib.token import create_token
+
+TOKENS = 100000
+
+tokens = [create_token() for i in xrange(0, TOKENS)]
+
+for count in [2, 4, 8]:
+    ring = HashRing([('node%d' % n, None) for n in xrange(0, count)])
+    before = [ring.name_for(token) for token in tokens]
+
+    shares = {}
+    for name in before:
+        shares[name] = shares.get(name, 0) + 1
+
+    ring.add('node%d' % count, None)
+    after = [ring.name_for(token) for token in tokens]
+    moved = sum(1 for old, new in zip(before, after) if old != new)
+    misplaced = sum(1 for old, new in zip(before, after) if old != new and new != 'node%d' % count)
+
+    print("%d -> %d nodes: %.1f%% of tokens moved (ideal %.1f%%), %d moved between old nodes, share per node %.1f%%-%.1f%%" % (
+        count, count + 1, 100.0 * moved / TOKENS, 100.0 / (count + 1), misplaced,
+        100.0 * min(shares.values()) / TOKENS, 100.0 * max(shares.values()) / TOKENS))
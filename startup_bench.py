@@ -0,0 +1,92 @@
+"""
+Startup time: interpreter alone, importing the application, and make_app() with a full view scan vs the precomputed
+view registry, each in fresh processes (best of ROUNDS). Prints the slowest imports, self and cumulative time in the
+style of python3 -X importtime (not available in python 2, so imports are timed through an __import__ hook), and
+appends a summary line to startup_times.log to track startup over time.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROUNDS = 5
+SLOWEST = 20
+
+here = os.path.dirname(os.path.abspath(__file__))
+settings_path = os.path.join(here, 'development.ini')
+log_path = os.path.join(here, 'startup_times.log')
+
+IMPORTS = r'''
+import json, sys, time
+import __builtin__
+
+real_import = __builtin__.__import__
+stack = []
+times = {}
+
+def timed_import(name, *args, **kwargs):
+    loaded = len(sys.modules)
+    stack.append(0.0)
+    start = time.time()
+    try:
+        return real_import(name, *args, **kwargs)
+    finally:
+        elapsed = time.time() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        # Only imports that loaded something count; the rest are dictionary lookups
+        if len(sys.modules) > loaded:
+            self_time, cumulative = times.get(name, (0, 0))
+            times[name] = (self_time + elapsed - nested, cumulative + elapsed)
+
+__builtin__.__import__ = timed_import
+import netl.application
+__builtin__.__import__ = real_import
+print(json.dumps(times))
+'''
+
+MAKE_APP = r'''
+import json, sys, time
+start = time.time()
+from netl.application import load_settings, make_app
+imported = time.time()
+settings = load_settings(sys.argv[1])
+settings['views.registry'] = sys.argv[2] == 'registry'
+make_app(settings)
+print(json.dumps([imported - start, time.time() - imported]))
+'''
+
+def run(code, *args):
+    start = time.time()
+    output = subprocess.check_output([sys.executable, '-c', code] + list(args), cwd=here)
+    return time.time() - start, output
+
+def best(code, *args):
+    return min(run(code, *args)[0] for i in xrange(0, ROUNDS))
+
+interpreter = best('pass')
+print("%-28s %7.1f ms" % ('interpreter', interpreter * 1000))
+
+elapsed, output = run(IMPORTS)
+times = json.loads(output)
+print("\n%10s %10s  %s" % ('self ms', 'cumul. ms', 'import'))
+for name, (self_time, cumulative) in sorted(times.items(), key=lambda t: -t[1][0])[:SLOWEST]:
+    print("%10.1f %10.1f  %s" % (self_time * 1000, cumulative * 1000, name))
+print('')
+
+results = {}
+for views in ('scan', 'registry'):
+    runs = [json.loads(run(MAKE_APP, settings_path, views)[1]) for i in xrange(0, ROUNDS)]
+    results['import'] = min(r[0] for r in runs)
+    results[views] = min(r[1] for r in runs)
+    print("%-28s %7.1f ms" % ('make_app, %s' % views, results[views] * 1000))
+print("%-28s %7.1f ms" % ('import netl.application', results['import'] * 1000))
+
+revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=here).strip()
+with open(log_path, 'a') as f:
+    f.write("%s %s interpreter=%.1f import=%.1f scan=%.1f registry=%.1f\n" % (
+        time.strftime('%Y-%m-%dT%H:%M:%S'), revision, interpreter * 1000, results['import'] * 1000,
+        results['scan'] * 1000, results['registry'] * 1000))
+print("\nAppended to %s" % log_path)
@@ -0,0 +1,50 @@
+"""
+First-render latency of each template in a fresh process, as a worker sees it after a deploy: compiled in memory (no
+module directory), loaded from modules compiled at build time, and already loaded at startup (warmed). Uses Mako
+directly with the lookup options netl.lib.templates gives Pyramid.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROUNDS = 10
+
+here = os.path.dirname(os.path.abspath(__file__))
+directory = os.path.join(here, 'netl', 'templates')
+
+FIRST_RENDER = r'''
+import sys, time
+from mako.lookup import TemplateLookup
+lookup = TemplateLookup(directories=[sys.argv[1]], module_directory=sys.argv[2] or None, input_encoding='utf-8',
+                        filesystem_checks=False)
+if sys.argv[4] == 'warm':
+    lookup.get_template(sys.argv[3])
+start = time.time()
+lookup.get_template(sys.argv[3]).render()
+print(time.time() - start)
+'''
+
+def first_render(uri, module_directory, mode):
+    times = [float(subprocess.check_output([sys.executable, '-c', FIRST_RENDER, directory, module_directory, uri, mode]))
+             for i in xrange(0, ROUNDS)]
+    return sorted(times)[len(times) // 2]
+
+uris = []
+for root, dirs, files in os.walk(directory):
+    uris.extend(os.path.relpath(os.path.join(root, name), directory) for name in files if name.endswith('.mako'))
+
+module_directory = tempfile.mkdtemp()
+try:
+    # Compile everything once, as compile_templates.py would
+    for uri in uris:
+        subprocess.check_output([sys.executable, '-c', FIRST_RENDER, directory, module_directory, uri, 'cold'])
+
+    print("%-30s %12s %12s %12s" % ('template', 'in memory', 'precompiled', 'warmed'))
+    for uri in sorted(uris):
+        print("%-30s %9.2f ms %9.2f ms %9.2f ms" % (uri, first_render(uri, '', 'cold') * 1000,
+                                                   first_render(uri, module_directory, 'cold') * 1000,
+                                                   first_render(uri, module_directory, 'warm') * 1000))
+finally:
+    shutil.rmtree(module_directory)
@@ -0,0 +1,59 @@
+"""
+Token minting throughput (one os.urandom call per token vs buffered entropy), plus statistical sanity checks on
+the output: uniqueness, byte distribution, bit balance, and distinct streams either side of a fork.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from hashlib import sha256
+import os
+import time
+from netl.lib.token import create_token, valid_token
+
+ROUNDS = 200000
+SAMPLE = 100000
+
+def unbuffered_token():
+    # As create_token() was before buffering
+    return urlsafe_b64encode(sha256(sha256(os.urandom(32)).digest()).digest())[:-2]
+
+for name, f in [('unbuffered', unbuffered_token), ('buffered', create_token)]:
+    start = time.time()
+    for i in xrange(0, ROUNDS):
+        f()
+    elapsed = time.time() - start
+    print("%-10s %8d tokens/s" % (name, ROUNDS / elapsed))
+
+start = time.time()
+for i in xrange(0, ROUNDS):
+    valid_token('A' * 41 + '_')
+print("valid_token %7d checks/s" % (ROUNDS / (time.time() - start)))
+
+tokens = [create_token() for i in xrange(0, SAMPLE)]
+assert all(valid_token(token) for token in tokens)
+assert len(set(tokens)) == SAMPLE, "duplicate tokens"
+
+# The first 40 chars decode to exactly 30 bytes
+data = ''.join(urlsafe_b64decode(token[:40]) for token in tokens)
+counts = [0] * 256
+for c in data:
+    counts[ord(c)] += 1
+expected = len(data) / 256.0
+chi2 = sum((count - expected) ** 2 / expected for count in counts)
+# 255 degrees of freedom: mean 255, standard deviation ~22.6
+print("byte distribution chi-squared %.1f (expect ~255, fail above 368)" % chi2)
+assert chi2 < 368, "byte distribution is not uniform"
+
+ones = sum(bin(ord(c)).count('1') for c in data)
+print("bit balance %.4f (expect 0.5)" % (ones / (len(data) * 8.0)))
+assert abs(ones / (len(data) * 8.0) - 0.5) < 0.001
+
+read, write = os.pipe()
+create_token()
+pid = os.fork()
+if not pid:
+    os.write(write, ''.join(create_token() for i in xrange(0, 10)))
+    os._exit(0)
+os.waitpid(pid, 0)
+child = os.read(read, 420)
+parent = ''.join(create_token() for i in xrange(0, 10))
+assert child != parent, "forked child repeats parent tokens"
+print("fork: child and parent streams differ")